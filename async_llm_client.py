@@ -0,0 +1,251 @@
+import time
+import asyncio
+import httpx
+
+from config import CLAUDE_CONFIG, SUMMARIZER_CONFIG, RESILIENCE_CONFIG
+from stats_collector import stats
+from response_cache import response_cache
+from token_budget import claude_budget
+from transport import adaptive_timeout, latency_tracker
+from circuit_breaker import claude_breaker, retry_wait
+from llm_client import (
+    CLAUDE_MESSAGES_URL,
+    claude_headers,
+    claude_payload,
+    prompt_tracker,
+    rate_limiter,
+    oversized_prompt_error,
+    record_token_counts,
+    build_chunk_messages,
+    build_method_messages,
+    build_file_messages,
+    build_single_file_messages,
+    build_section_messages,
+    build_package_messages,
+    build_project_messages
+)
+
+
+class AsyncTransport:
+    """One HTTP/2 client and in-flight limit per event loop"""
+
+    def __init__(self, max_in_flight):
+        self.max_in_flight = max_in_flight
+        self.client = None
+        self.semaphore = None
+
+    def _ensure_client(self):
+        if self.client is None:
+            # a single multiplexed connection carries many concurrent streams
+            self.client = httpx.AsyncClient(
+                http2=True,
+                limits=httpx.Limits(
+                    max_connections=SUMMARIZER_CONFIG["max_workers"],
+                    max_keepalive_connections=SUMMARIZER_CONFIG["max_workers"]
+                )
+            )
+            self.semaphore = asyncio.Semaphore(self.max_in_flight)
+
+    async def post(self, url, headers, payload, timeout):
+        stats.log_request_sent()
+        self._ensure_client()
+        async with self.semaphore:
+            return await self.client.post(url, headers=headers, json=payload, timeout=timeout)
+
+    async def post_adaptive(self, url, headers, payload, category, predicted_tokens, rate_limiter):
+        """Async post_adaptive; the losing request of a hedged pair is cancelled outright"""
+        timeout = adaptive_timeout(predicted_tokens)
+        hedge_after = latency_tracker.hedge_delay(category)
+        started = time.monotonic()
+
+        primary = asyncio.ensure_future(self.post(url, headers, payload, timeout))
+        if hedge_after is None:
+            response = await primary
+        else:
+            response = await self._hedge(primary, url, headers, payload, timeout, category, hedge_after,
+                                         rate_limiter, predicted_tokens)
+
+        if response.status_code == 200:
+            latency_tracker.record(category, time.monotonic() - started)
+        return response
+
+    async def _hedge(self, primary, url, headers, payload, timeout, category, hedge_after, rate_limiter, predicted_tokens):
+        done, _ = await asyncio.wait({primary}, timeout=hedge_after)
+        if done:
+            return primary.result()
+
+        wait_time = rate_limiter.reserve(predicted_tokens)
+        if wait_time > 0:
+            done, _ = await asyncio.wait({primary}, timeout=wait_time)
+            if done:
+                return primary.result()
+
+        stats.log_llm_call("api_request")
+        latency_tracker.record_hedge(category)
+        hedge = asyncio.ensure_future(self.post(url, headers, payload, timeout))
+        pending = {primary, hedge}
+
+        while True:
+            done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+            winner = next((task for task in done if task.exception() is None), None)
+            if winner is not None or not pending:
+                break
+
+        for task in pending:
+            task.cancel()
+
+        if winner is None:
+            winner = done.pop()
+        stats.log_hedge(category, won=winner is hedge)
+        return winner.result()
+
+    async def close(self):
+        if self.client is not None:
+            await self.client.aclose()
+        self.client = None
+        self.semaphore = None
+
+
+async_transport = AsyncTransport(SUMMARIZER_CONFIG["max_in_flight"])
+
+
+async def call_claude_async(messages, max_retries=RESILIENCE_CONFIG["max_attempts"], api_key=CLAUDE_CONFIG["api_key"], category=None, saves_call=None):
+    """Async counterpart of call_claude_with_backoff; sleeps never block the loop"""
+    payload = claude_payload(messages, category)
+    predicted_tokens = claude_budget.count_payload(payload)
+    error = oversized_prompt_error(predicted_tokens, claude_budget)
+    if error:
+        print(error)
+        return error
+
+    cache_key = response_cache.make_key(payload)
+    cached = response_cache.get(cache_key)
+    if cached is not None:
+        return cached
+
+    claude_breaker.record_request()
+    last_error = "no attempt made"
+    rate_limited = False
+
+    for attempt in range(max_retries):
+        if attempt > 0 and not rate_limited and not claude_breaker.allow_retry():
+            return f"Error: Retry budget exhausted after {attempt} attempts: {last_error}"
+        if not claude_breaker.allow_request():
+            return f"Error: Claude API circuit breaker is open: {last_error}"
+
+        rate_limited = False
+        try:
+            stats.log_llm_call("api_request")
+
+            wait_time = rate_limiter.reserve(predicted_tokens)
+            if wait_time > 0:
+                await asyncio.sleep(wait_time)
+            started = time.monotonic()
+
+            response = await async_transport.post_adaptive(
+                CLAUDE_MESSAGES_URL,
+                claude_headers(api_key),
+                payload,
+                category,
+                predicted_tokens,
+                rate_limiter
+            )
+        except httpx.HTTPError as e:
+            claude_breaker.record_failure()
+            last_error = str(e)
+        except Exception:
+            # anything unexpected still resolves a half-open probe before it propagates
+            claude_breaker.record_failure()
+            raise
+        except BaseException:
+            # interrupted rather than failed, but the probe slot must not stay taken
+            claude_breaker.release_probe()
+            raise
+        else:
+            rate_limiter.update_from_headers(response.headers)
+
+            if response.status_code == 200:
+                try:
+                    result = response.json()
+                    text = result["content"][0]["text"]
+                except (ValueError, KeyError, IndexError, TypeError) as e:
+                    # a body we cannot read is as good as no answer, so retry it
+                    claude_breaker.record_failure()
+                    last_error = f"Malformed response: {e!r}"
+                else:
+                    claude_breaker.record_success()
+                    rate_limiter.record_usage(result.get("usage", {}), predicted_tokens)
+                    stats.log_llm_response(category, result.get("usage", {}), time.monotonic() - started)
+                    record_token_counts(category, result.get("usage", {}), predicted_tokens, claude_budget)
+                    if saves_call:
+                        stats.log_call_saved(saves_call)
+                    response_cache.put(cache_key, text)
+                    return text
+            elif response.status_code == 429:
+                claude_breaker.record_success()
+                rate_limited = True
+                if "retry-after" not in response.headers:
+                    rate_limiter.pause(retry_wait(attempt))
+                print(f"Rate limited, pausing all requests for {rate_limiter.blocked_for():.1f} seconds...")
+                continue
+            elif response.status_code >= 500:
+                claude_breaker.record_failure()
+                last_error = f"HTTP {response.status_code}: {response.text[:200]}"
+            else:
+                claude_breaker.record_success()
+                return f"Error: Request rejected with HTTP {response.status_code}: {response.text[:200]}"
+
+        if attempt < max_retries - 1:
+            wait_time = retry_wait(attempt)
+            print(f"Request failed (attempt {attempt + 1}), retrying in {wait_time:.1f}s...")
+            await asyncio.sleep(wait_time)
+
+    return f"Error: Failed to get response after {max_retries} attempts: {last_error}"
+
+
+async def summarize_chunk_async(chunk_content, context=""):
+    messages = build_chunk_messages(chunk_content, context)
+    stats.log_llm_call("chunk_summary")
+    return await call_claude_async(messages, category="chunk_summary")
+
+
+async def summarize_method_async(method_content, file_path, method_name):
+    messages = build_method_messages(method_content, file_path, method_name)
+    stats.log_llm_call("method_summary")
+    return await call_claude_async(messages, category="method_summary")
+
+
+async def summarize_file_async(chunk_summaries, file_path, unit="Chunk"):
+    messages = build_file_messages(chunk_summaries, file_path, unit)
+    stats.log_llm_call("file_summary")
+
+    response = await call_claude_async(messages, category="file_summary")
+    prompt_tracker.log_prompt("file_summary", messages, response)
+    return response
+
+
+async def summarize_single_chunk_file_async(chunk_content, context, file_path):
+    messages = build_single_file_messages(chunk_content, context, file_path)
+    stats.log_llm_call("single_file_summary")
+
+    response = await call_claude_async(messages, category="single_file_summary", saves_call="single_chunk_file")
+    prompt_tracker.log_prompt("single_file_summary", messages, response)
+    return response
+
+
+async def summarize_section_async(chunk_summaries, file_path, start_line, end_line):
+    messages = build_section_messages(chunk_summaries, file_path, start_line, end_line)
+    stats.log_llm_call("section_summary")
+    return await call_claude_async(messages, category="section_summary")
+
+
+async def summarize_package_async(named_summaries, package_path):
+    messages = build_package_messages(named_summaries, package_path)
+    stats.log_llm_call("package_summary")
+    return await call_claude_async(messages, category="package_summary")
+
+
+async def summarize_project_async(file_summaries, project_path, unit="File"):
+    messages = build_project_messages(file_summaries, project_path, unit)
+    stats.log_llm_call("project_summary")
+    return await call_claude_async(messages, category="project_summary")
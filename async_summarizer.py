@@ -0,0 +1,177 @@
+import time
+import asyncio
+from collections import defaultdict
+
+from stats_collector import stats
+from summarizer import SharedCache, CompletionTracker, dependency_key, single_file_failed
+from summarizer import known_chunk_summary, store_chunk_summary, is_single_chunk_file, chunk_result, dependency_context
+from summarizer import known_method_summary, record_method_summary, known_section_summary, reduced_section, section_part
+from summarizer import ordered_parts, section_groups, known_file_summary, record_file_summary, publish_file_summary
+from async_llm_client import summarize_chunk_async, summarize_method_async, summarize_file_async, summarize_section_async
+from async_llm_client import summarize_single_chunk_file_async
+
+
+class AsyncSummarizerAgent:
+    """Event-loop version of SummarizerAgent and FileFinalizer; one instance serves every
+    chunk. The bookkeeping is theirs, only the calls are awaited here"""
+
+    def __init__(self, dependency_detector, shared_cache, max_dependency_context, writer, expected_chunks, journal, manifest, section_size, reducer=None, single_chunk_fast_path=True):
+        self.dependency_detector = dependency_detector
+        self.shared_cache = shared_cache
+        self.max_dependency_context = max_dependency_context
+        self.writer = writer
+        # only ever used from the event loop, so its lock is never contended
+        self.completion_tracker = CompletionTracker(expected_chunks, section_size)
+        self.journal = journal
+        self.manifest = manifest
+        self.section_size = section_size
+        # file path -> tasks summarizing its sections, for files of more than section_size chunks
+        self.section_tasks = defaultdict(list)
+        self.reducer = reducer
+        self.single_chunk_fast_path = single_chunk_fast_path
+
+    async def process_chunk(self, chunk):
+        chunk_summary, is_file_summary = known_chunk_summary(self, chunk)
+
+        if chunk_summary is None:
+            dependencies = self.dependency_detector.find_dependencies(chunk)
+            context = await self._gather_dependency_context(dependencies)
+
+            is_file_summary = is_single_chunk_file(self, chunk)
+            if is_file_summary:
+                chunk_summary = await summarize_single_chunk_file_async(chunk['content'], context, chunk['file_path'])
+                is_file_summary = not single_file_failed(chunk, chunk_summary)
+            if not is_file_summary:
+                chunk_summary = await summarize_chunk_async(chunk['content'], context)
+            store_chunk_summary(self, chunk, chunk_summary, dependencies, is_file_summary)
+
+        # no await between adding the chunk and the completeness check, so exactly one
+        # coroutine sees the file finish
+        file_path = chunk['file_path']
+        section, completed_chunks = self.completion_tracker.add_chunk(
+            file_path,
+            chunk_result(chunk, chunk_summary, is_file_summary)
+        )
+        if section is not None:
+            self.section_tasks[file_path].append(asyncio.ensure_future(
+                self._reduce_parts(file_path, sorted(section, key=lambda x: x['start_line']))
+            ))
+
+        if completed_chunks is None:
+            return chunk_summary, None
+
+        file_summary = await self._generate_file_summary(file_path, completed_chunks)
+        publish_file_summary(self, file_path, file_summary)
+        return chunk_summary, file_summary
+
+    async def _gather_dependency_context(self, dependencies):
+        dependencies = dependencies[:self.max_dependency_context]
+        # exceptions cover both our own failed call and a failure or timeout we awaited
+        summaries = await asyncio.gather(*[
+            self.shared_cache.get_or_compute(
+                dependency_key(dep),
+                lambda dep=dep: self._summarize_dependency_method(dep)
+            )
+            for dep in dependencies
+        ], return_exceptions=True)
+        return dependency_context(dependencies, summaries)
+
+    async def _summarize_dependency_method(self, dependency):
+        method_key, method_content, journaled = known_method_summary(self, dependency)
+        if journaled is not None:
+            return journaled
+
+        method_summary = await summarize_method_async(
+            method_content,
+            dependency['file_path'],
+            dependency['method_name']
+        )
+        return record_method_summary(self, dependency, method_key, method_summary)
+
+    async def _reduce_parts(self, file_path, parts):
+        if len(parts) == 1:
+            return parts
+        section_key, summary = known_section_summary(self, file_path, parts)
+        if summary is not None:
+            return section_part(parts, summary)
+
+        summary = await summarize_section_async([part['summary'] for part in parts], file_path, parts[0]['start_line'], parts[-1]['end_line'])
+        return reduced_section(self, file_path, parts, section_key, summary)
+
+    async def _file_parts(self, file_path, chunks, section_tasks):
+        if not section_tasks:
+            return chunks
+
+        parts = ordered_parts(await asyncio.gather(*section_tasks))
+
+        while len(parts) > self.section_size:
+            reduced = [
+                part for section in await asyncio.gather(*[
+                    self._reduce_parts(file_path, group) for group in section_groups(parts, self.section_size)
+                ])
+                for part in section
+            ]
+            if len(reduced) == len(parts):
+                break
+            parts = reduced
+        return parts
+
+    async def _generate_file_summary(self, file_path, chunk_results):
+        chunks = sorted(chunk_results, key=lambda x: x['start_line'])
+        section_tasks = self.section_tasks.pop(file_path, [])
+
+        file_key, file_summary = known_file_summary(self, file_path, chunks)
+        if file_summary is None:
+            parts = await self._file_parts(file_path, chunks, section_tasks)
+            file_summary = await summarize_file_async(
+                [part['summary'] for part in parts],
+                file_path,
+                "Section" if section_tasks else "Chunk"
+            )
+            record_file_summary(self, file_path, file_key, file_summary)
+        # a reused summary leaves its sections running; let them finish on this loop
+        await asyncio.gather(*section_tasks)
+        return file_summary
+
+
+class AsyncSharedCache:
+    """Method summary cache where concurrent requesters await one task and all see
+    its exception if it fails; failures are not cached. Summaries are kept in a
+    SharedCache, so the same byte bound, LRU eviction and admission policy apply"""
+
+    def __init__(self, max_bytes, admission="tinylfu", wait_timeout=None):
+        self.store = SharedCache(max_bytes, admission)
+        self.pending = {}
+        self.wait_timeout = wait_timeout
+
+    async def get_or_compute(self, key, compute_coro):
+        cached = self.store.get(key)
+        if cached is not None:
+            stats.log_cache_hit()
+            return cached
+
+        task = self.pending.get(key)
+        if task is not None:
+            stats.log_cache_coalesced()
+            return await self._wait_for(task)
+
+        stats.log_cache_miss()
+        task = asyncio.ensure_future(compute_coro())
+        self.pending[key] = task
+        try:
+            result = await task
+        finally:
+            # a later requester may already have started a task of its own
+            if self.pending.get(key) is task:
+                del self.pending[key]
+
+        self.store.put(key, result)
+        return result
+
+    async def _wait_for(self, task):
+        started = time.monotonic()
+        try:
+            # shielded, so a waiter that gives up does not cancel the owner's call
+            return await asyncio.wait_for(asyncio.shield(task), self.wait_timeout)
+        finally:
+            stats.log_cache_wait(time.monotonic() - started, timed_out=not task.done())
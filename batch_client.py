@@ -0,0 +1,138 @@
+import time
+import json
+
+from config import CLAUDE_CONFIG
+from stats_collector import stats
+from transport import transport
+from response_cache import response_cache
+from llm_client import claude_headers, claude_payload
+
+
+class MessageBatchClient:
+    """Submits prompts through the Message Batches API and collects their text results"""
+
+    def __init__(self, base_url, api_key, batch_size, poll_interval, timeout):
+        self.batches_url = f"{base_url}/v1/messages/batches"
+        self.api_key = api_key
+        self.batch_size = batch_size
+        self.poll_interval = poll_interval
+        self.timeout = timeout
+
+    def run(self, prompts, category, saves_call=None):
+        """Resolve {key: messages} to {key: text}; keys that fail are left out, as are
+        those of a batch that could not be submitted or did not end within the timeout,
+        so the caller can send them to the live API. saves_call is counted per batch
+        result, not for answers already in the response cache"""
+        results = {}
+        custom_ids = {}
+        cache_keys = {}
+        requests = []
+
+        for key, messages in prompts.items():
+            payload = claude_payload(messages, category)
+            cache_key = response_cache.make_key(payload)
+            cached = response_cache.get(cache_key)
+            if cached is not None:
+                results[key] = cached
+                continue
+
+            # custom ids must be short and alphanumeric, so map them back afterwards
+            custom_id = f"{category}-{len(requests)}"
+            custom_ids[custom_id] = key
+            cache_keys[custom_id] = cache_key
+            requests.append({"custom_id": custom_id, "params": payload})
+
+        deadline = time.time() + self.timeout
+        batch_ids = []
+        for start in range(0, len(requests), self.batch_size):
+            batch_requests = requests[start:start + self.batch_size]
+            try:
+                batch_ids.append(self.submit(batch_requests))
+            except Exception as e:
+                print(f"Could not submit {len(batch_requests)} {category} requests as a batch: {e!r}")
+                continue
+
+            for _ in range(len(batch_requests)):
+                stats.log_llm_call(category)
+
+        for batch_id in batch_ids:
+            try:
+                batch = self.wait(batch_id, deadline)
+                texts = self.results(batch, category)
+            except Exception as e:
+                print(f"Giving up on batch {batch_id}: {e!r}")
+                self.cancel(batch_id)
+                continue
+
+            for custom_id, text in texts.items():
+                if saves_call:
+                    stats.log_call_saved(saves_call)
+                response_cache.put(cache_keys[custom_id], text)
+                results[custom_ids[custom_id]] = text
+
+        print(f"Batched {len(requests)} {category} requests, {len(results)}/{len(prompts)} succeeded")
+        return results
+
+    def submit(self, requests):
+        stats.log_llm_call("batch_request")
+        response = transport.post(self.batches_url, claude_headers(self.api_key), {"requests": requests}, timeout=300)
+        response.raise_for_status()
+
+        batch = response.json()
+        print(f"Submitted batch {batch['id']} with {len(requests)} requests")
+        return batch["id"]
+
+    def wait(self, batch_id, deadline):
+        while True:
+            response = transport.session.get(
+                f"{self.batches_url}/{batch_id}",
+                headers=claude_headers(self.api_key),
+                timeout=60
+            )
+            response.raise_for_status()
+
+            batch = response.json()
+            if batch["processing_status"] == "ended":
+                return batch
+
+            if time.time() >= deadline:
+                raise TimeoutError(f"batch {batch_id} still processing after {self.timeout}s")
+
+            counts = batch.get("request_counts", {})
+            print(f"Batch {batch_id}: {counts.get('processing', '?')} requests still processing")
+            time.sleep(min(self.poll_interval, max(deadline - time.time(), 0)))
+
+    def cancel(self, batch_id):
+        """Asks the API to stop a batch we no longer wait for; requests it already ran are still billed"""
+        try:
+            transport.post(f"{self.batches_url}/{batch_id}/cancel", claude_headers(self.api_key), {}, timeout=60)
+        except Exception as e:
+            print(f"Could not cancel batch {batch_id}: {e!r}")
+
+    def results(self, batch, category):
+        response = transport.session.get(batch["results_url"], headers=claude_headers(self.api_key), timeout=300)
+        response.raise_for_status()
+
+        texts = {}
+        for line in response.text.splitlines():
+            if not line.strip():
+                continue
+
+            entry = json.loads(line)
+            result = entry["result"]
+            if result["type"] == "succeeded":
+                stats.log_llm_response(category, result["message"].get("usage", {}))
+                texts[entry["custom_id"]] = result["message"]["content"][0]["text"]
+            else:
+                print(f"Batch request {entry['custom_id']} {result['type']}")
+
+        return texts
+
+
+batch_client = MessageBatchClient(
+    CLAUDE_CONFIG["base_url"],
+    CLAUDE_CONFIG["api_key"],
+    CLAUDE_CONFIG["batch_size"],
+    CLAUDE_CONFIG["batch_poll_interval"],
+    CLAUDE_CONFIG["batch_timeout"]
+)
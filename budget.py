@@ -0,0 +1,95 @@
+import math
+import time
+
+from stats_collector import stats
+
+
+class SummaryBudget:
+    """Caps a run at a number of API requests, billed tokens or minutes; a limit left
+    as None does not apply. Chunks already queued count toward it at the cost per
+    chunk seen so far, so files are admitted only while the limit can cover them"""
+
+    def __init__(self, max_calls=None, max_tokens=None, max_minutes=None):
+        self.max_calls = max_calls
+        self.max_tokens = max_tokens
+        self.max_minutes = max_minutes
+        self.started = time.time()
+
+    def exhausted(self, pending_chunks=0, completed_chunks=0):
+        """The name of the first limit that spending so far plus the pending chunks
+        would reach, or None"""
+        calls, tokens = stats.spent()
+        if completed_chunks:
+            calls += pending_chunks * calls / completed_chunks
+            tokens += pending_chunks * tokens / completed_chunks
+        else:
+            # every chunk costs at least its own request
+            calls += pending_chunks
+        if self.max_calls is not None and calls >= self.max_calls:
+            return "calls"
+        if self.max_tokens is not None and tokens >= self.max_tokens:
+            return "tokens"
+        if self.max_minutes is not None and self.minutes() >= self.max_minutes:
+            return "minutes"
+        return None
+
+    def minutes(self):
+        return (time.time() - self.started) / 60
+
+    def usage(self):
+        calls, tokens = stats.spent()
+        return {
+            "limits": {"calls": self.max_calls, "tokens": self.max_tokens, "minutes": self.max_minutes},
+            "spent": {"calls": calls, "tokens": tokens, "minutes": self.minutes()}
+        }
+
+
+def file_centrality(file_paths, dependency_detector, damping=0.85, iterations=30):
+    """PageRank over the file call graph: a file scores high when files that score
+    high call into it. Scores sum to 1"""
+    if not file_paths:
+        return {}
+
+    file_set = set(file_paths)
+    calls = {file_path: dependency_detector.file_calls(file_path) & file_set for file_path in file_paths}
+    count = len(file_paths)
+    rank = {file_path: 1 / count for file_path in file_paths}
+
+    for _ in range(iterations):
+        # files that call nothing spread their score over every file
+        dangling = sum(rank[file_path] for file_path, targets in calls.items() if not targets)
+        base = (1 - damping + damping * dangling) / count
+        next_rank = dict.fromkeys(file_paths, base)
+        for file_path, targets in calls.items():
+            for target in targets:
+                next_rank[target] += damping * rank[file_path] / len(targets)
+        rank = next_rank
+    return rank
+
+
+def rank_files(file_paths, dependency_detector, file_size):
+    """Returns (files in priority order, centrality per file). Priority is centrality
+    weighed by the log of the file size, so of two equally central files the larger,
+    which holds more of the project, goes first"""
+    centrality = file_centrality(file_paths, dependency_detector)
+    ordered = sorted(
+        file_paths,
+        key=lambda file_path: centrality[file_path] * math.log2(2 + file_size(file_path) / 1024),
+        reverse=True
+    )
+    return ordered, centrality
+
+
+def coverage_metrics(centrality, file_size, covered, stopped_by, budget):
+    """How much of the project the summarized files account for, by count, bytes and centrality"""
+    total_bytes = sum(file_size(file_path) for file_path in centrality)
+    covered_bytes = sum(file_size(file_path) for file_path in covered)
+    return {
+        "stopped_by": stopped_by,
+        **budget.usage(),
+        "files_total": len(centrality),
+        "files_covered": len(covered),
+        "file_coverage": len(covered) / len(centrality) if centrality else 0,
+        "byte_coverage": covered_bytes / total_bytes if total_bytes else 0,
+        "centrality_coverage": sum(centrality.get(file_path, 0) for file_path in covered)
+    }
@@ -12,6 +12,13 @@ class Chunker:
     def create_chunks(self, file_paths):
         all_chunks = []
         
+        for file_path, file_chunks in self.iter_file_chunks(file_paths):
+            all_chunks.extend(file_chunks)
+        
+        return all_chunks
+
+    def iter_file_chunks(self, file_paths):
+        """Yields (file_path, chunks) one file at a time so callers can start on early files"""
         for i, file_path in enumerate(file_paths):
             print(f"Processing file {i+1}/{len(file_paths)}: {file_path}")
             try:
@@ -19,13 +26,12 @@ class Chunker:
                     content = f.read()
                 
                 file_chunks = self._chunk_file(file_path, content)
-                all_chunks.extend(file_chunks)
                 
             except Exception as e:
                 print(f"Error processing {file_path}: {e}")
                 continue
-        
-        return all_chunks
+
+            yield file_path, file_chunks
 
     def _chunk_file(self, file_path, content):
         lines = content.split('\n')
@@ -50,6 +56,7 @@ class Chunker:
             
             chunk = {
                 'file_path': file_path,
+                'chunk_index': len(chunks),
                 'content': chunk_content,
                 'start_line': start_line,
                 'end_line': end_line,
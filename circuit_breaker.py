@@ -0,0 +1,110 @@
+import time
+import threading
+
+from config import RESILIENCE_CONFIG
+from stats_collector import stats
+
+
+CLOSED = "closed"
+OPEN = "open"
+HALF_OPEN = "half_open"
+
+
+class CircuitBreaker:
+    """Shared failure detector for one provider; fails callers fast while it is down"""
+
+    def __init__(self, name, failure_threshold, recovery_timeout, retry_budget, min_retries_per_second):
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.recovery_timeout = recovery_timeout
+        self.retry_budget = retry_budget
+        self.min_retries_per_second = min_retries_per_second
+        self.lock = threading.Lock()
+        self.state = CLOSED
+        self.consecutive_failures = 0
+        self.opened_at = 0
+        self.probe_in_flight = False
+        # each first attempt deposits retry_budget tokens and each retry spends one,
+        # so retries stay a bounded fraction of total traffic
+        self.retry_tokens = 10.0
+        self.retry_refilled = time.monotonic()
+        stats.log_breaker_state(name, CLOSED)
+
+    def allow_request(self):
+        with self.lock:
+            if self.state == CLOSED:
+                return True
+
+            if self.state == OPEN:
+                if time.monotonic() - self.opened_at < self.recovery_timeout:
+                    return False
+                self._transition(HALF_OPEN)
+
+            # half open: let a single probe through to test the provider
+            if self.probe_in_flight:
+                return False
+            self.probe_in_flight = True
+            return True
+
+    def record_request(self):
+        with self.lock:
+            self.retry_tokens = min(self.retry_tokens + self.retry_budget, 100.0)
+
+    def allow_retry(self):
+        with self.lock:
+            now = time.monotonic()
+            self.retry_tokens = min(self.retry_tokens + (now - self.retry_refilled) * self.min_retries_per_second, 100.0)
+            self.retry_refilled = now
+
+            if self.retry_tokens < 1:
+                stats.log_retry_denied(self.name)
+                return False
+            self.retry_tokens -= 1
+            return True
+
+    def record_success(self):
+        with self.lock:
+            self.consecutive_failures = 0
+            self.probe_in_flight = False
+            if self.state != CLOSED:
+                self._transition(CLOSED)
+
+    def record_failure(self):
+        with self.lock:
+            self.consecutive_failures += 1
+            self.probe_in_flight = False
+
+            if self.state == HALF_OPEN or self.consecutive_failures >= self.failure_threshold:
+                self.opened_at = time.monotonic()
+                if self.state != OPEN:
+                    self._transition(OPEN)
+
+    def release_probe(self):
+        """Frees the half-open probe slot of a call that ended without an outcome"""
+        with self.lock:
+            if self.state == HALF_OPEN:
+                self.probe_in_flight = False
+
+    def _transition(self, state):
+        print(f"Circuit breaker {self.name}: {self.state} -> {state}")
+        self.state = state
+        stats.log_breaker_state(self.name, state)
+
+
+def retry_wait(attempt):
+    """Capped exponential backoff with jitter"""
+    return min(2 ** attempt, RESILIENCE_CONFIG["max_backoff"]) + (time.time() % 1)
+
+
+def make_breaker(name):
+    return CircuitBreaker(
+        name,
+        RESILIENCE_CONFIG["failure_threshold"],
+        RESILIENCE_CONFIG["recovery_timeout"],
+        RESILIENCE_CONFIG["retry_budget"],
+        RESILIENCE_CONFIG["min_retries_per_second"]
+    )
+
+
+claude_breaker = make_breaker("claude")
+openai_breaker = make_breaker("openai")
@@ -3,8 +3,54 @@
 CLAUDE_CONFIG = {
     "model": "claude-3-5-haiku-20241022",
     "api_key": "<your api key>",
+    "base_url": "https://api.anthropic.com",  # or a local mock_api_server.py
+    "context_window": 200000,
     "max_tokens": 4000,
-    "temperature": 0
+    "temperature": 0,
+    "min_cacheable_prefix_tokens": 2048,  # shortest system prompt the model caches (1024 on sonnet and opus)
+    # starting limits; refined from the api's rate-limit response headers
+    "requests_per_minute": 50,
+    "input_tokens_per_minute": 50000,
+    "output_tokens_per_minute": 10000,
+    "batch_size": 10000,  # requests per message batch in batch mode
+    "batch_poll_interval": 30,
+    "batch_timeout": 6 * 3600  # seconds to wait on batches before sending what is left to the live api
+}
+
+OPENAI_CONFIG = {
+    "model": "gpt-4o-mini",
+    "api_key": "<your api key>",
+    "context_window": 128000,
+    "max_tokens": 4000,
+    "temperature": 0,
+    "requests_per_minute": 500,
+    "input_tokens_per_minute": 200000,
+    "output_tokens_per_minute": 200000
+}
+
+LLM_CACHE_CONFIG = {
+    "enabled": True,
+    "path": "cache/llm_responses.sqlite",
+    "max_bytes": 512 * 1024 * 1024  # least recently used responses are evicted past this
+}
+
+TRANSPORT_CONFIG = {
+    "base_timeout": 30,  # seconds, plus timeout_per_1k_tokens for each 1k prompt tokens
+    "timeout_per_1k_tokens": 2,
+    "max_timeout": 300,
+    "hedge_requests": False,  # send a duplicate once a call runs past its category's p95
+    "hedge_categories": ["chunk_summary", "method_summary"],
+    "hedge_min_samples": 20,
+    "hedge_budget": 0.05  # at most this fraction of a category's requests are hedged
+}
+
+RESILIENCE_CONFIG = {
+    "max_attempts": 5,  # per call, including the first
+    "max_backoff": 30,  # seconds between attempts
+    "failure_threshold": 5,  # consecutive failures that open the circuit
+    "recovery_timeout": 30,  # seconds open before a half-open probe
+    "retry_budget": 0.2,  # retries allowed as a fraction of first attempts
+    "min_retries_per_second": 1
 }
 
 CHUNKING_CONFIG = {
@@ -22,5 +68,23 @@ PROJECT_CONFIG = {
 
 SUMMARIZER_CONFIG = {
     "max_workers": 10,
-    "max_dependency_context": 10
+    "max_dependency_context": 10,
+    "execution_mode": "threads",  # "threads", "async" or "batch"
+    "max_in_flight": 200,  # concurrent requests in async mode
+    "cache_wait_timeout": 120,  # seconds to wait on a method summary another thread or task is computing; None waits forever
+    "method_cache_max_bytes": 64 * 1024 * 1024,
+    "method_cache_admission": "tinylfu",  # or "always" for plain LRU
+    "dependency_scheduling": True,  # summarize called methods before the chunks that use them
+    "max_pending_chunks": 100,  # chunks queued or running before chunking pauses
+    "journal_dir": "checkpoints",  # append-only log of finished summaries, read back by --resume
+    "manifest_dir": "manifests",  # content hashes and summaries of the last run, read back by --incremental
+    "project_reduction": "hierarchical",  # package tree reduced upward, or "flat" for one call over every file
+    "reduce_fan_in": 20,  # most summaries in one file, section or package prompt; longer files reduce in sections
+    "single_chunk_fast_path": True,  # files of one chunk get their file summary from the chunk call itself
+    "results_dir": "results",  # file summaries stream to summary_<project>.jsonl as they finish
+    "compress_results": False,  # gzip the stream to summary_<project>.jsonl.gz
+    "summary_store": True,  # also write summary_<project>.sqlite for sampling and lookups by path
+    "shard_workers": 4,  # local worker processes a --shards run starts; 0 leaves the shards to --worker processes elsewhere
+    "shard_lease_seconds": 120,  # a worker silent this long loses its shard to the next worker that asks
+    "export_summary_json": True  # also write the summary_<project>.json layout from the stream
 }
\ No newline at end of file
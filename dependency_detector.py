@@ -1,13 +1,20 @@
 import os
 import re
+import threading
 
 from stats_collector import stats
 
 
+IMPORT_PATTERN = re.compile(r'^\s*import\s+([^;]+);', re.MULTILINE)
+
+
 class DependencyDetector:
     def __init__(self, project_files):
         self.project_files = project_files
-        self.project_index = self._build_project_index()
+        self.project_file_set = set(project_files)
+        # filled lazily per file, so dependencies resolve before the whole project is scanned
+        self.project_index = {}
+        self.index_lock = threading.Lock()
 
     def find_dependencies(self, chunk):
         dependencies = []
@@ -23,6 +30,26 @@ class DependencyDetector:
         
         return dependencies
 
+    def resolve_calls(self, chunk):
+        """Each distinct call's dependency, without counting toward the run's stats"""
+        dependencies = []
+        for call in set(self._extract_method_calls(chunk['content'])):
+            resolved_dep = self._resolve_dependency(call, chunk)
+            if resolved_dep:
+                dependencies.append(resolved_dep)
+        return dependencies
+
+    def file_calls(self, file_path):
+        """Other project files whose methods this file calls"""
+        try:
+            with open(file_path, 'r', encoding='utf-8') as f:
+                content = f.read()
+        except Exception:
+            return set()
+
+        whole_file = {'file_path': file_path, 'content': content, 'imports': IMPORT_PATTERN.findall(content)}
+        return {dep['file_path'] for dep in self.resolve_calls(whole_file)} - {file_path}
+
     def _extract_method_calls(self, content):
         method_pattern = r'(\w+)\.(\w+)\s*\('
         calls = []
@@ -86,35 +113,42 @@ class DependencyDetector:
         current_dir = os.path.dirname(current_file)
         target_file = os.path.join(current_dir, f'{class_name}.java')
         
-        if target_file in self.project_files:
+        if target_file in self.project_file_set:
             return target_file
         
         return None
 
     def _method_exists_in_file(self, file_path, method_name):
-        if file_path not in self.project_index:
+        if file_path not in self.project_file_set:
             return False
         
-        return method_name in self.project_index[file_path]['methods']
+        return method_name in self._index_entry(file_path)['methods']
 
-    def _build_project_index(self):
-        index = {}
-        
+    def warm_index(self):
+        """Index every project file ahead of the lookups that need them"""
         for file_path in self.project_files:
-            try:
-                with open(file_path, 'r', encoding='utf-8') as f:
-                    content = f.read()
-                
-                classes = self._extract_classes_from_file(content)
-                index[file_path] = {
-                    'methods': self._extract_methods_from_file(content),
-                    'classes': classes
-                }
-                
-            except Exception:
-                index[file_path] = {'methods': [], 'classes': {}}
-        
-        return index
+            self._index_entry(file_path)
+
+    def _index_entry(self, file_path):
+        entry = self.project_index.get(file_path)
+        if entry is not None:
+            return entry
+
+        try:
+            with open(file_path, 'r', encoding='utf-8') as f:
+                content = f.read()
+            
+            classes = self._extract_classes_from_file(content)
+            entry = {
+                'methods': set(self._extract_methods_from_file(content)),
+                'classes': classes
+            }
+            
+        except Exception:
+            entry = {'methods': set(), 'classes': {}}
+
+        with self.index_lock:
+            return self.project_index.setdefault(file_path, entry)
 
     def _extract_methods_from_file(self, content):
         method_pattern = r'(?:public|private|protected|static|\s)+[\w\<\>\[\]]+\s+(\w+)\s*\([^)]*\)\s*\{'
@@ -170,10 +204,10 @@ class DependencyDetector:
         return classes
 
     def _find_class_in_same_file(self, file_path, class_name):
-        if file_path not in self.project_index:
+        if file_path not in self.project_file_set:
             return False
         
-        return class_name in self.project_index[file_path]['classes']
+        return class_name in self._index_entry(file_path)['classes']
 
     def _method_exists_in_class(self, file_path, class_name, method_name):
         if not self._find_class_in_same_file(file_path, class_name):
@@ -184,7 +218,7 @@ class DependencyDetector:
                 content = f.read()
             
             lines = content.split('\n')
-            class_start = self.project_index[file_path]['classes'][class_name]
+            class_start = self._index_entry(file_path)['classes'][class_name]
             
             in_target_class = False
             brace_count = 0
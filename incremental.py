@@ -0,0 +1,336 @@
+import os
+import re
+import json
+import tempfile
+import threading
+import subprocess
+
+from stats_collector import stats
+from journal import content_hash
+
+
+# string literals are matched first so comment markers inside them survive
+CODE_TOKEN_PATTERN = re.compile(r'"(?:\\.|[^"\\])*"|\'(?:\\.|[^\'\\])*\'|//[^\n]*|/\*.*?\*/', re.DOTALL)
+
+
+def normalize_code(content):
+    """Java source with comments removed and whitespace collapsed, so edits to
+    either leave it unchanged"""
+    def strip_comment(match):
+        token = match.group(0)
+        return ' ' if token.startswith('/') else token
+
+    return ' '.join(CODE_TOKEN_PATTERN.sub(strip_comment, content).split())
+
+
+def code_hash(content):
+    return content_hash(normalize_code(content))
+
+
+class Manifest:
+    """Per-file content hashes, chunk summaries with the dependency methods they
+    were written against, and file and project summaries from the last run.
+    With incremental set, a file whose code and dependencies are unchanged keeps
+    its summary, and within a changed file only chunks whose code or dependency
+    methods moved are summarized again.
+
+    A file's entry moves to a temporary log once its summary is recorded, as does
+    every reduction, so only the files still in progress hold their chunk
+    summaries in memory; save() streams the log into the manifest"""
+
+    def __init__(self, path, project_dir, incremental=False):
+        self.path = path
+        self.project_dir = project_dir
+        self.dependency_detector = None
+        self.lock = threading.Lock()
+        self.previous = {"files": {}}
+        # path -> entry for this run, reduced to its hashes once it is in the log
+        self.files = {}
+        # (kind, key) of every entry in the log
+        self.logged = set()
+        self.log = None
+        self.project = None
+        self.method_hashes = {}
+        # files whose code hash matches the previous run, so their methods are unchanged too
+        self.same_code = set()
+
+        if incremental and os.path.exists(path):
+            with open(path, 'r', encoding='utf-8') as f:
+                self.previous = json.load(f)
+            print(f"Incremental run against {path} with {len(self.previous['files'])} files")
+
+    def plan(self, java_files, dependency_detector):
+        """Returns (files to summarize, file summaries reused from the last run)"""
+        self.dependency_detector = dependency_detector
+        changed_paths = self._git_changed_paths()
+        to_process = []
+        reused = {}
+
+        for file_path in java_files:
+            old = self.previous["files"].get(file_path)
+            if old is not None and changed_paths is not None and os.path.normpath(file_path) not in changed_paths:
+                raw_hash, new_code_hash = old["raw_hash"], old["code_hash"]
+            else:
+                raw_hash, new_code_hash = self._hash_file(file_path)
+
+            entry = {"raw_hash": raw_hash, "code_hash": new_code_hash, "chunks": {}}
+            self.files[file_path] = entry
+
+            if old is None:
+                stats.log_incremental("files_new")
+            elif old["raw_hash"] == raw_hash:
+                stats.log_incremental("files_unchanged")
+                self.same_code.add(file_path)
+            elif old["code_hash"] == new_code_hash:
+                stats.log_incremental("files_comment_or_whitespace_only")
+                self.same_code.add(file_path)
+            else:
+                stats.log_incremental("files_changed")
+
+        for file_path in java_files:
+            old = self.previous["files"].get(file_path)
+            if (file_path in self.same_code and old.get("summary")
+                    and not any(self._dependencies_changed(chunk) for chunk in old["chunks"].values())):
+                self.files[file_path].update(chunks=old["chunks"], file_key=old["file_key"], summary=old["summary"])
+                reused[file_path] = old["summary"]
+            else:
+                if file_path in self.same_code:
+                    stats.log_incremental("files_with_changed_dependencies")
+                to_process.append(file_path)
+
+        print(f"Incremental plan: {len(to_process)} files to summarize, {len(reused)} reused")
+        return to_process, reused
+
+    def content_hash(self, file_path):
+        return self.files.get(file_path, {}).get("raw_hash")
+
+    def reusable_chunk_summary(self, chunk):
+        old = self.previous["files"].get(chunk['file_path'])
+        if old is None:
+            return None
+
+        old_chunk = old["chunks"].get(code_hash(chunk['content']))
+        if old_chunk is None or self._dependencies_changed(old_chunk):
+            return None
+
+        stats.log_incremental("chunks_reused")
+        self._store_chunk(chunk, old_chunk)
+        return old_chunk["summary"]
+
+    def record_chunk(self, chunk, summary, dependencies):
+        if not summary or summary.startswith("Error:"):
+            return
+
+        self._store_chunk(chunk, {
+            "summary": summary,
+            "dependencies": [
+                {
+                    "file_path": dep['file_path'],
+                    "class_name": dep['class_name'],
+                    "method_name": dep['method_name'],
+                    "hash": self._method_hash(dep)
+                }
+                for dep in dependencies
+            ]
+        })
+
+    def reusable_file_summary(self, file_path, file_key):
+        """The last run's summary when this file's chunk summaries came out the same"""
+        old = self.previous["files"].get(file_path)
+        if old is None or old.get("file_key") != file_key or not old.get("summary"):
+            return None
+        stats.log_incremental("file_summaries_reused")
+        return old["summary"]
+
+    def record_file(self, file_path, file_key, summary):
+        if not summary or summary.startswith("Error:"):
+            return
+        with self.lock:
+            entry = self.files.setdefault(file_path, {"chunks": {}})
+            entry["file_key"] = file_key
+            entry["summary"] = summary
+            self._log_file(file_path, entry)
+
+    def reusable_project_summary(self, file_summaries):
+        project_key = self._project_key(file_summaries)
+        old = self.previous.get("project")
+        if old is None or old["key"] != project_key:
+            return None
+        stats.log_incremental("project_summary_reused")
+        self.project = old
+        return old["summary"]
+
+    def record_project(self, file_summaries, summary):
+        if summary and not summary.startswith("Error:"):
+            self.project = {"key": self._project_key(file_summaries), "summary": summary}
+
+    def reusable_reduction(self, reduction_key):
+        """A package or file section summary from the last run with exactly these inputs"""
+        summary = self.previous.get("reductions", {}).get(reduction_key)
+        if summary is None:
+            return None
+        stats.log_incremental("reductions_reused")
+        self.record_reduction(reduction_key, summary)
+        return summary
+
+    def record_reduction(self, reduction_key, summary):
+        if summary and not summary.startswith("Error:"):
+            with self.lock:
+                self._append("reduction", reduction_key, summary)
+
+    def snapshot(self):
+        """This run's file entries and reductions, for a shard to hand to the coordinator"""
+        with self.lock:
+            return {"files": dict(self._iter_files()), "reductions": dict(self._iter_logged("reduction"))}
+
+    def merge(self, snapshot):
+        with self.lock:
+            for file_path, entry in snapshot["files"].items():
+                self._log_file(file_path, entry)
+            for reduction_key, summary in snapshot["reductions"].items():
+                self._append("reduction", reduction_key, summary)
+
+    def save(self):
+        # a run that failed before planning or merging shards has nothing to add to the last manifest
+        if not self.files:
+            return
+
+        directory = os.path.dirname(self.path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+
+        dirty = ((self._git_paths("diff", "--name-only", "--relative", "HEAD", "--") or set())
+                 | (self._git_paths("ls-files", "--others", "--exclude-standard") or set()))
+        header = {
+            "commit": self._git("rev-parse", "HEAD"),
+            "dirty": sorted(dirty),
+            "project": self.project
+        }
+
+        # replace in one step so an interrupted save leaves the old manifest intact
+        temp_path = self.path + ".tmp"
+        with self.lock, open(temp_path, 'w', encoding='utf-8') as f:
+            # the same layout json.dump would write, one entry at a time
+            f.write(json.dumps(header, ensure_ascii=False)[:-1])
+            f.write(', "reductions": ')
+            self._write_object(f, self._iter_logged("reduction"))
+            f.write(', "files": ')
+            self._write_object(f, self._iter_files())
+            f.write('}')
+        os.replace(temp_path, self.path)
+
+    def _write_object(self, f, items):
+        f.write('{')
+        for i, (key, value) in enumerate(items):
+            if i:
+                f.write(', ')
+            f.write(f'{json.dumps(key, ensure_ascii=False)}: {json.dumps(value, ensure_ascii=False)}')
+        f.write('}')
+
+    def _log_file(self, file_path, entry):
+        """Moves a finished file's entry to the log, keeping its hashes in memory"""
+        self._append("file", file_path, entry)
+        self.files[file_path] = {"raw_hash": entry.get("raw_hash"), "code_hash": entry.get("code_hash")}
+
+    def _append(self, kind, key, value):
+        if (kind, key) in self.logged:
+            return
+        if self.log is None:
+            # removed by the system once closed, so nothing is left behind after a crash
+            self.log = tempfile.TemporaryFile('w+', encoding='utf-8')
+        self.log.write(json.dumps([kind, key, value], ensure_ascii=False) + '\n')
+        self.logged.add((kind, key))
+
+    def _iter_logged(self, kind):
+        if self.log is None:
+            return
+        self.log.flush()
+        self.log.seek(0)
+        try:
+            for line in self.log:
+                entry_kind, key, value = json.loads(line)
+                if entry_kind == kind:
+                    yield key, value
+        finally:
+            self.log.seek(0, os.SEEK_END)
+
+    def _iter_files(self):
+        yield from self._iter_logged("file")
+        for file_path, entry in self.files.items():
+            if ("file", file_path) not in self.logged:
+                yield file_path, entry
+
+    def _store_chunk(self, chunk, chunk_entry):
+        with self.lock:
+            entry = self.files.setdefault(chunk['file_path'], {"chunks": {}})
+            entry["chunks"][code_hash(chunk['content'])] = chunk_entry
+
+    def _project_key(self, file_summaries):
+        return content_hash(*[f"{path}\0{summary}" for path, summary in sorted(file_summaries.items())])
+
+    def _dependencies_changed(self, chunk_entry):
+        for dep in chunk_entry["dependencies"]:
+            if dep["file_path"] in self.same_code:
+                continue
+            if self._method_hash(dep) != dep["hash"]:
+                return True
+        return False
+
+    def _method_hash(self, dependency):
+        key = f"{dependency['file_path']}::{dependency['class_name']}::{dependency['method_name']}"
+        method_hash = self.method_hashes.get(key)
+        if method_hash is None:
+            # a shard plans only its own files, so look the dependency up in the whole project
+            if dependency['file_path'] in self.dependency_detector.project_file_set:
+                method_content = self.dependency_detector.extract_method_from_file(
+                    dependency['file_path'],
+                    dependency['method_name']
+                )
+                method_hash = code_hash(method_content)
+            else:
+                # the file is gone, so anything written against it is stale
+                method_hash = "missing"
+            self.method_hashes[key] = method_hash
+        return method_hash
+
+    def _hash_file(self, file_path):
+        try:
+            with open(file_path, 'r', encoding='utf-8') as f:
+                content = f.read()
+        except Exception:
+            return None, None
+        return content_hash(content), code_hash(content)
+
+    def _git_changed_paths(self):
+        """Paths that may differ from the last run, or None to hash every file. Files
+        that were uncommitted last time are included, since git cannot vouch for them"""
+        commit = self.previous.get("commit")
+        if not commit:
+            return None
+
+        changed = self._git_paths("diff", "--name-only", "--relative", commit, "--")
+        untracked = self._git_paths("ls-files", "--others", "--exclude-standard")
+        if changed is None or untracked is None:
+            return None
+
+        return changed | untracked | set(self.previous.get("dirty", []))
+
+    def _git_paths(self, *args):
+        output = self._git(*args)
+        if output is None:
+            return None
+        return {os.path.normpath(os.path.join(self.project_dir, line)) for line in output.splitlines() if line}
+
+    def _git(self, *args):
+        try:
+            result = subprocess.run(
+                ["git", "-C", self.project_dir, *args],
+                capture_output=True,
+                text=True,
+                timeout=60
+            )
+        except (OSError, subprocess.SubprocessError):
+            return None
+        if result.returncode != 0:
+            return None
+        return result.stdout.strip()
@@ -0,0 +1,75 @@
+import os
+import json
+import hashlib
+import threading
+
+
+def content_hash(*parts):
+    digest = hashlib.sha256()
+    for part in parts:
+        digest.update(str(part).encode('utf-8'))
+        digest.update(b'\0')
+    return digest.hexdigest()
+
+
+class Journal:
+    """Append-only log of finished chunk, method and file summaries keyed by content
+    hash, flushed line by line so an interrupted run can resume where it stopped.
+    Only the summaries of the run being resumed are held in memory; those recorded
+    now go straight to disk"""
+
+    def __init__(self, path, resume=False):
+        self.path = path
+        self.entries = {}
+        self.lock = threading.Lock()
+
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+
+        if resume and os.path.exists(path):
+            self._load()
+            print(f"Resuming from {path} with {len(self.entries)} journaled summaries")
+
+        self.file = open(path, 'a' if resume else 'w', encoding='utf-8')
+
+    def _load(self):
+        complete = 0
+        with open(self.path, 'rb') as f:
+            for line in f:
+                if not line.endswith(b'\n'):
+                    # the last line is cut short if the process died mid-write
+                    break
+                complete += len(line)
+                try:
+                    entry = json.loads(line)
+                except (json.JSONDecodeError, UnicodeDecodeError):
+                    continue
+                self.entries[(entry['kind'], entry['key'])] = entry['summary']
+
+        # drop the partial line, or the next record would be glued onto it
+        if complete < os.path.getsize(self.path):
+            os.truncate(self.path, complete)
+
+    def get(self, kind, key):
+        return self.entries.get((kind, key))
+
+    def record(self, kind, key, summary, file_path=None):
+        # failed calls come back as error strings; leave them out so a resume retries them
+        if not summary or summary.startswith("Error:"):
+            return
+
+        line = json.dumps({"kind": kind, "key": key, "path": file_path, "summary": summary}, ensure_ascii=False)
+        with self.lock:
+            if self.file.closed:
+                return
+            self.file.write(line + '\n')
+            self.file.flush()
+
+    def close(self):
+        with self.lock:
+            if self.file.closed:
+                return
+            self.file.flush()
+            os.fsync(self.file.fileno())
+            self.file.close()
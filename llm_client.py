@@ -5,8 +5,12 @@ import requests
 import random
 import threading
 
-from config import CLAUDE_CONFIG
+from config import CLAUDE_CONFIG, RESILIENCE_CONFIG
 from stats_collector import stats
+from transport import transport
+from response_cache import response_cache
+from token_budget import claude_budget
+from circuit_breaker import claude_breaker, retry_wait
 
 
 class PromptTracker:
@@ -40,82 +44,360 @@ class PromptTracker:
 prompt_tracker = PromptTracker()
 
 
-def call_claude_with_backoff(messages, max_retries=10, api_key=CLAUDE_CONFIG["api_key"]):
-    """Simple exponential backoff for Claude API calls"""
+class TokenBucket:
+    def __init__(self, per_minute):
+        self.capacity = per_minute
+        self.tokens = per_minute
+        self.updated = time.monotonic()
+
+    def set_limit(self, per_minute):
+        self.capacity = per_minute
+        self.tokens = min(self.tokens, per_minute)
+
+    def refill(self, now):
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.capacity / 60)
+        self.updated = now
+
+    def take(self, amount, now):
+        """Reserve capacity, going into debt if needed; returns seconds until the debt clears"""
+        self.refill(now)
+        self.tokens -= min(amount, self.capacity)
+        if self.tokens >= 0:
+            return 0
+        return -self.tokens * 60 / self.capacity
+
+
+class RateLimiter:
+    """Process-wide pacing for requests, input tokens and output tokens per minute"""
+
+    # (bucket, limit header, remaining header) for anthropic and openai responses
+    HEADERS = [
+        ("requests", "anthropic-ratelimit-requests-limit", "anthropic-ratelimit-requests-remaining"),
+        ("input_tokens", "anthropic-ratelimit-input-tokens-limit", "anthropic-ratelimit-input-tokens-remaining"),
+        ("output_tokens", "anthropic-ratelimit-output-tokens-limit", "anthropic-ratelimit-output-tokens-remaining"),
+        ("requests", "x-ratelimit-limit-requests", "x-ratelimit-remaining-requests"),
+        ("input_tokens", "x-ratelimit-limit-tokens", "x-ratelimit-remaining-tokens"),
+    ]
+
+    def __init__(self, requests_per_minute, input_tokens_per_minute, output_tokens_per_minute):
+        self.lock = threading.Lock()
+        self.buckets = {
+            "requests": TokenBucket(requests_per_minute),
+            "input_tokens": TokenBucket(input_tokens_per_minute),
+            "output_tokens": TokenBucket(output_tokens_per_minute)
+        }
+        self.blocked_until = 0
+        self.average_output_tokens = 500
+
+    def reserve(self, input_tokens, output_tokens=None):
+        """Claim capacity for one request and return how long to wait before sending it"""
+        if output_tokens is None:
+            output_tokens = self.average_output_tokens
+
+        with self.lock:
+            now = time.monotonic()
+            wait = max(self.blocked_until - now, 0)
+            wait = max(wait, self.buckets["requests"].take(1, now))
+            wait = max(wait, self.buckets["input_tokens"].take(input_tokens, now))
+            wait = max(wait, self.buckets["output_tokens"].take(output_tokens, now))
+            return wait
+
+    def acquire(self, input_tokens):
+        wait = self.reserve(input_tokens)
+        if wait > 0:
+            time.sleep(wait)
+
+    def record_usage(self, usage, estimated_input):
+        """Settle the difference between the reserved estimate and what the API billed"""
+        input_tokens = usage.get("input_tokens", usage.get("prompt_tokens", estimated_input))
+        output_tokens = usage.get("output_tokens", usage.get("completion_tokens", self.average_output_tokens))
+
+        with self.lock:
+            now = time.monotonic()
+            self.buckets["input_tokens"].take(input_tokens - estimated_input, now)
+            self.buckets["output_tokens"].take(output_tokens - self.average_output_tokens, now)
+            self.average_output_tokens = int(0.9 * self.average_output_tokens + 0.1 * output_tokens)
+
+    def update_from_headers(self, headers):
+        with self.lock:
+            now = time.monotonic()
+            for name, limit_header, remaining_header in self.HEADERS:
+                bucket = self.buckets[name]
+                limit = _header_number(headers, limit_header)
+                if limit:
+                    bucket.set_limit(limit)
+
+                remaining = _header_number(headers, remaining_header)
+                if remaining is not None:
+                    bucket.refill(now)
+                    bucket.tokens = min(bucket.tokens, remaining)
+
+            retry_after = _header_number(headers, "retry-after")
+            if retry_after is not None:
+                self.blocked_until = max(self.blocked_until, now + retry_after)
+
+    def pause(self, seconds):
+        """Hold every caller back, e.g. after a 429 without a retry-after header"""
+        with self.lock:
+            self.blocked_until = max(self.blocked_until, time.monotonic() + seconds)
+
+    def blocked_for(self):
+        return max(self.blocked_until - time.monotonic(), 0)
+
+
+def _header_number(headers, name):
+    value = headers.get(name)
+    if value is None:
+        return None
+    try:
+        return float(value)
+    except ValueError:
+        return None
+
+
+rate_limiter = RateLimiter(
+    CLAUDE_CONFIG["requests_per_minute"],
+    CLAUDE_CONFIG["input_tokens_per_minute"],
+    CLAUDE_CONFIG["output_tokens_per_minute"]
+)
+
+
+CLAUDE_MESSAGES_URL = f"{CLAUDE_CONFIG['base_url']}/v1/messages"
+
+
+def claude_headers(api_key):
+    return {
+        "Content-Type": "application/json",
+        "x-api-key": api_key,
+        "anthropic-version": "2023-06-01"
+    }
+
+
+def claude_payload(messages, category=None):
+    payload = {
+        "model": CLAUDE_CONFIG["model"],
+        "max_tokens": CLAUDE_CONFIG["max_tokens"],
+        "temperature": CLAUDE_CONFIG["temperature"],
+        "messages": messages
+    }
+
+    # fixed instructions go first as a system block; the api only caches a prefix
+    # past the model's minimum length, so shorter ones are sent without the marker
+    if category in SYSTEM_PROMPTS:
+        block = {"type": "text", "text": SYSTEM_PROMPTS[category]}
+        if claude_budget.count(block["text"]) >= CLAUDE_CONFIG["min_cacheable_prefix_tokens"]:
+            block["cache_control"] = {"type": "ephemeral"}
+        payload["system"] = [block]
+
+    return payload
+
+
+def oversized_prompt_error(predicted_tokens, budget):
+    """Error string for prompts that cannot fit, or None; these are never worth retrying"""
+    if predicted_tokens <= budget.input_budget:
+        return None
+    return f"Error: Prompt of ~{predicted_tokens} tokens exceeds the {budget.input_budget} token input budget"
+
+
+def record_token_counts(category, usage, predicted_tokens, budget):
+    actual_tokens = sum(usage.get(key) or 0 for key in
+                        ("input_tokens", "cache_creation_input_tokens", "cache_read_input_tokens"))
+    stats.log_token_estimate(category, predicted_tokens, actual_tokens)
+    budget.calibrate(predicted_tokens, actual_tokens)
+
+
+def call_claude_with_backoff(messages, max_retries=RESILIENCE_CONFIG["max_attempts"], api_key=CLAUDE_CONFIG["api_key"], category=None, saves_call=None):
+    """Claude API call with capped backoff behind the shared circuit breaker and retry budget.
+    saves_call names the call a live answer makes unnecessary, counted only on success"""
+    payload = claude_payload(messages, category)
+    predicted_tokens = claude_budget.count_payload(payload)
+    error = oversized_prompt_error(predicted_tokens, claude_budget)
+    if error:
+        print(error)
+        return error
+
+    cache_key = response_cache.make_key(payload)
+    cached = response_cache.get(cache_key)
+    if cached is not None:
+        return cached
+
+    claude_breaker.record_request()
+    last_error = "no attempt made"
+    rate_limited = False
+
     for attempt in range(max_retries):
+        # 429s are paced by the rate limiter and do not spend the retry budget
+        if attempt > 0 and not rate_limited and not claude_breaker.allow_retry():
+            return f"Error: Retry budget exhausted after {attempt} attempts: {last_error}"
+        if not claude_breaker.allow_request():
+            return f"Error: Claude API circuit breaker is open: {last_error}"
+
+        rate_limited = False
         try:
             stats.log_llm_call("api_request")
 
-            headers = {
-                "Content-Type": "application/json",
-                "x-api-key": api_key,
-                "anthropic-version": "2023-06-01"
-            }
-            
-            payload = {
-                "model": CLAUDE_CONFIG["model"],
-                "max_tokens": CLAUDE_CONFIG["max_tokens"],
-                "temperature": CLAUDE_CONFIG["temperature"],
-                "messages": messages
-            }
+            headers = claude_headers(api_key)
+            rate_limiter.acquire(predicted_tokens)
+            started = time.monotonic()
             
-            response = requests.post(
-                "https://api.anthropic.com/v1/messages",
-                headers=headers,
-                json=payload,
-                timeout=60
+            response = transport.post_adaptive(
+                CLAUDE_MESSAGES_URL,
+                headers,
+                payload,
+                category,
+                predicted_tokens,
+                rate_limiter
             )
+        except requests.exceptions.RequestException as e:
+            claude_breaker.record_failure()
+            last_error = str(e)
+        except Exception:
+            # anything unexpected still resolves a half-open probe before it propagates
+            claude_breaker.record_failure()
+            raise
+        except BaseException:
+            # interrupted rather than failed, but the probe slot must not stay taken
+            claude_breaker.release_probe()
+            raise
+        else:
+            rate_limiter.update_from_headers(response.headers)
             
             if response.status_code == 200:
-                result = response.json()
-                return result["content"][0]["text"]
+                try:
+                    result = response.json()
+                    text = result["content"][0]["text"]
+                except (ValueError, KeyError, IndexError, TypeError) as e:
+                    # a body we cannot read is as good as no answer, so retry it
+                    claude_breaker.record_failure()
+                    last_error = f"Malformed response: {e!r}"
+                else:
+                    claude_breaker.record_success()
+                    rate_limiter.record_usage(result.get("usage", {}), predicted_tokens)
+                    stats.log_llm_response(category, result.get("usage", {}), time.monotonic() - started)
+                    record_token_counts(category, result.get("usage", {}), predicted_tokens, claude_budget)
+                    if saves_call:
+                        stats.log_call_saved(saves_call)
+                    response_cache.put(cache_key, text)
+                    return text
             elif response.status_code == 429:
-                wait_time = (2 ** attempt) + (time.time() % 1)
-                print(f"Rate limited, waiting {wait_time:.1f} seconds...")
-                time.sleep(wait_time)
+                # the provider answered, so this is not an outage
+                claude_breaker.record_success()
+                rate_limited = True
+                if "retry-after" not in response.headers:
+                    rate_limiter.pause(retry_wait(attempt))
+                print(f"Rate limited, pausing all requests for {rate_limiter.blocked_for():.1f} seconds...")
                 continue
+            elif response.status_code >= 500:
+                claude_breaker.record_failure()
+                last_error = f"HTTP {response.status_code}: {response.text[:200]}"
             else:
-                response.raise_for_status()
-                
-        except requests.exceptions.RequestException as e:
-            if attempt == max_retries - 1:
-                return f"Error: Failed to get response after {max_retries} attempts: {str(e)}"
-            
-            wait_time = (2 ** attempt) + (time.time() % 1)
+                claude_breaker.record_success()
+                return f"Error: Request rejected with HTTP {response.status_code}: {response.text[:200]}"
+
+        if attempt < max_retries - 1:
+            wait_time = retry_wait(attempt)
             print(f"Request failed (attempt {attempt + 1}), retrying in {wait_time:.1f}s...")
             time.sleep(wait_time)
     
-    return "Error: Max retries exceeded"
+    return f"Error: Failed to get response after {max_retries} attempts: {last_error}"
 
 
-def summarize_chunk(chunk_content, context=""):
-    context_section = ""
-    if context.strip():
-        context_section = f"\n\nDependency Context:\n{context}"
-    
-    prompt = f"""Summarize what this Java code does.
+CHUNK_INSTRUCTIONS = """Summarize what the Java code in the user message does.
 
-Code:
+Describe:
+1. What this code does
+2. Which methods it calls (from the dependency context if provided)
+3. What data it manipulates
+
+Be specific and direct. Do not infer design patterns or architectural intent."""
+
+
+FILE_INSTRUCTIONS = """Write a 3-4 sentence technical summary of a file based on the code section summaries in the user message.
+
+Focus ONLY on what the code actually does:
+1. What is the primary purpose of this file?
+2. What are the key methods and what do they do?
+3. What data does it manage and how?
+
+Do NOT:
+- Infer design patterns unless explicitly mentioned in the summaries
+- Describe architectural decisions not evident in the summaries
+- Make recommendations for future improvements
+- Discuss scalability, complexity ratings, or maintainability
+- Speculate about "potential integrations" or "system roles"
+
+Be specific. Be direct. Synthesize only what you see in the summaries."""
+
+
+SECTION_INSTRUCTIONS = """Summarize one section of a long file based on the summaries of its consecutive code chunks in the user message.
+
+Describe in 2-4 sentences:
+1. What the methods in this section do
+2. What data they manipulate
+
+Be specific and direct. Do not speculate beyond the summaries."""
+
+
+PACKAGE_INSTRUCTIONS = """Write a 3-5 sentence technical summary of a package based on the summaries of its files and subpackages in the user message.
+
+Focus ONLY on what the code actually does:
+1. What is the shared responsibility of this package?
+2. Which files or subpackages carry the main functionality, and what do they do?
+3. How do they work together, where the summaries say so?
+
+Do NOT speculate beyond the summaries. Be specific. Be direct."""
+
+
+SINGLE_FILE_INSTRUCTIONS = """Write a 3-4 sentence technical summary of a file from its complete Java code in the user message.
+
+Focus ONLY on what the code actually does:
+1. What is the primary purpose of this file?
+2. What are the key methods and what do they do, including the methods they call (from the dependency context if provided)?
+3. What data does it manage and how?
+
+Do NOT:
+- Infer design patterns or architectural intent
+- Make recommendations for future improvements
+- Discuss scalability, complexity ratings, or maintainability
+- Speculate about "potential integrations" or "system roles"
+
+Be specific. Be direct."""
+
+
+SYSTEM_PROMPTS = {
+    "chunk_summary": CHUNK_INSTRUCTIONS,
+    "file_summary": FILE_INSTRUCTIONS,
+    "single_file_summary": SINGLE_FILE_INSTRUCTIONS,
+    "section_summary": SECTION_INSTRUCTIONS,
+    "package_summary": PACKAGE_INSTRUCTIONS
+}
+
+
+def build_chunk_messages(chunk_content, context=""):
+    # dependency context is the optional part, so it gives way first
+    reserved = claude_budget.count(CHUNK_INSTRUCTIONS) + claude_budget.count(chunk_content) + 50
+    context = claude_budget.fit_text(context, reserved)
+
+    prompt = f"""Code:
 ```java
 {chunk_content}
 ```
 
 Dependency Context:
-{context}
+{context}"""
 
-Describe:
-1. What this code does
-2. Which methods it calls (from the dependency context if provided)
-3. What data it manipulates
+    return [{"role": "user", "content": prompt}]
 
-Be specific and direct. Do not infer design patterns or architectural intent."""
 
-    messages = [{"role": "user", "content": prompt}]
+def summarize_chunk(chunk_content, context=""):
+    messages = build_chunk_messages(chunk_content, context)
     stats.log_llm_call("chunk_summary")
-    return call_claude_with_backoff(messages)
+    return call_claude_with_backoff(messages, category="chunk_summary")
 
 
-def summarize_method(method_content, file_path, method_name):
+def build_method_messages(method_content, file_path, method_name):
+    method_content = claude_budget.fit_text(method_content, 150)
+
     prompt = f"""Summarize this Java method for dependency analysis.
 
 Method: {method_name} in {file_path}
@@ -131,44 +413,86 @@ Provide a concise technical summary covering:
 
 Keep to 1-2 precise sentences for use as dependency context."""
 
-    messages = [{"role": "user", "content": prompt}]
+    return [{"role": "user", "content": prompt}]
+
+
+def summarize_method(method_content, file_path, method_name):
+    messages = build_method_messages(method_content, file_path, method_name)
     stats.log_llm_call("method_summary")
-    return call_claude_with_backoff(messages)
+    return call_claude_with_backoff(messages, category="method_summary")
 
 
-def summarize_file(chunk_summaries, file_path):
-    chunks_text = "\n\n".join([f"Chunk {i+1}: {summary}" for i, summary in enumerate(chunk_summaries)])
+def build_file_messages(chunk_summaries, file_path, unit="Chunk"):
+    """unit labels the summaries: "Chunk", or "Section" for a long file reduced in sections"""
+    chunk_summaries = claude_budget.fit_items(chunk_summaries, claude_budget.count(FILE_INSTRUCTIONS) + 50)
+    chunks_text = "\n\n".join([f"{unit} {i+1}: {summary}" for i, summary in enumerate(chunk_summaries)])
     
-    prompt = f"""Write a 3-4 sentence technical summary of this file based on the code section summaries below.
-
-File: {file_path}
+    prompt = f"""File: {file_path}
 
 Code Section Summaries:
-{chunks_text}
-
-Focus ONLY on what the code actually does:
-1. What is the primary purpose of this file?
-2. What are the key methods and what do they do?
-3. What data does it manage and how?
+{chunks_text}"""
 
-Do NOT:
-- Infer design patterns unless explicitly mentioned in the summaries
-- Describe architectural decisions not evident in the summaries
-- Make recommendations for future improvements
-- Discuss scalability, complexity ratings, or maintainability
-- Speculate about "potential integrations" or "system roles"
+    return [{"role": "user", "content": prompt}]
 
-Be specific. Be direct. Synthesize only what you see in the summaries."""
 
-    messages = [{"role": "user", "content": prompt}]
+def summarize_file(chunk_summaries, file_path, unit="Chunk"):
+    messages = build_file_messages(chunk_summaries, file_path, unit)
     stats.log_llm_call("file_summary")
 
-    response = call_claude_with_backoff(messages)
+    response = call_claude_with_backoff(messages, category="file_summary")
     prompt_tracker.log_prompt("file_summary", messages, response)
     return response #call_claude_with_backoff(messages)
 
 
+def build_single_file_messages(chunk_content, context, file_path):
+    """A file that fits in one chunk, summarized with its dependency context in one call"""
+    reserved = claude_budget.count(SINGLE_FILE_INSTRUCTIONS) + claude_budget.count(chunk_content) + 70
+    context = claude_budget.fit_text(context, reserved)
+
+    prompt = f"""File: {file_path}
+
+Code:
+```java
+{chunk_content}
+```
+
+Dependency Context:
+{context}"""
+
+    return [{"role": "user", "content": prompt}]
+
+
+def summarize_single_chunk_file(chunk_content, context, file_path):
+    messages = build_single_file_messages(chunk_content, context, file_path)
+    stats.log_llm_call("single_file_summary")
+
+    response = call_claude_with_backoff(messages, category="single_file_summary", saves_call="single_chunk_file")
+    prompt_tracker.log_prompt("single_file_summary", messages, response)
+    return response
+
+
+def build_section_messages(chunk_summaries, file_path, start_line, end_line):
+    chunk_summaries = claude_budget.fit_items(chunk_summaries, claude_budget.count(SECTION_INSTRUCTIONS) + 50)
+    chunks_text = "\n\n".join([f"Chunk {i+1}: {summary}" for i, summary in enumerate(chunk_summaries)])
+
+    prompt = f"""File: {file_path}
+Lines: {start_line + 1}-{end_line}
+
+Chunk Summaries:
+{chunks_text}"""
+
+    return [{"role": "user", "content": prompt}]
+
+
+def summarize_section(chunk_summaries, file_path, start_line, end_line):
+    messages = build_section_messages(chunk_summaries, file_path, start_line, end_line)
+    stats.log_llm_call("section_summary")
+    return call_claude_with_backoff(messages, category="section_summary")
+
+
 def summarize_file_single_llm(file_content, file_path):
+    file_content = claude_budget.fit_text(file_content, 300)
+
     prompt = f"""Write a 3-4 sentence technical summary of this file.
 
 File: {file_path}
@@ -192,19 +516,40 @@ Do NOT:
 Be specific. Be direct. Synthesize only what you see in the summaries."""
 
     messages = [{"role": "user", "content": prompt}]
-    return call_claude_with_backoff(messages)
+    return call_claude_with_backoff(messages, category="baseline_file_summary")
 
 
-def summarize_project(file_summaries, project_path):
-    """Create project-level summary from file summaries"""
-    files_text = "\n\n".join([f"File: {i+1}\n{summary}" for i, summary in enumerate(file_summaries)])
+def build_package_messages(named_summaries, package_path):
+    """named_summaries holds (file or subpackage name, summary) pairs"""
+    items = [f"{name}:\n{summary}" for name, summary in named_summaries]
+    items = claude_budget.fit_items(items, claude_budget.count(PACKAGE_INSTRUCTIONS) + 50)
+    items_text = "\n\n".join(items)
+
+    prompt = f"""Package: {package_path}
+
+File and Subpackage Summaries:
+{items_text}"""
+
+    return [{"role": "user", "content": prompt}]
+
+
+def summarize_package(named_summaries, package_path):
+    messages = build_package_messages(named_summaries, package_path)
+    stats.log_llm_call("package_summary")
+    return call_claude_with_backoff(messages, category="package_summary")
+
+
+def build_project_messages(file_summaries, project_path, unit="File"):
+    """unit names what the summaries describe: "File", or "Package" for a reduced tree"""
+    file_summaries = claude_budget.fit_items(file_summaries, 200)
+    files_text = "\n\n".join([f"{unit}: {i+1}\n{summary}" for i, summary in enumerate(file_summaries)])
     
-    prompt = f"""Create a high-level project summary from these file summaries.
+    prompt = f"""Create a high-level project summary from these {unit.lower()} summaries.
 
 Project: {project_path}
-Total Files: {len(file_summaries)}
+Total {unit}s: {len(file_summaries)}
 
-File Summaries:
+{unit} Summaries:
 {files_text}
 
 Provide a project summary that includes:
@@ -216,6 +561,11 @@ Provide a project summary that includes:
 
 Focus on the big picture and overall system architecture."""
 
-    messages = [{"role": "user", "content": prompt}]
+    return [{"role": "user", "content": prompt}]
+
+
+def summarize_project(file_summaries, project_path, unit="File"):
+    """Create project-level summary from file summaries"""
+    messages = build_project_messages(file_summaries, project_path, unit)
     stats.log_llm_call("project_summary")
-    return call_claude_with_backoff(messages)
+    return call_claude_with_backoff(messages, category="project_summary")
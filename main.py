@@ -1,7 +1,12 @@
 import os
-import json
+import time
+import signal
+import socket
+import asyncio
+import argparse
 import psutil
 import threading
+import multiprocessing
 from concurrent.futures import ThreadPoolExecutor
 from collections import defaultdict
 
@@ -10,134 +15,736 @@ from stats_collector import stats
 from code_analyzer import CodeAnalyzer
 from chunk_processor import Chunker
 from dependency_detector import DependencyDetector
-from summarizer import SummarizerAgent, SharedCache
-from llm_client import summarize_project
+from summarizer import SummarizerAgent, SharedCache, CompletionTracker, FileFinalizer
+from summarizer import dependency_key, method_journal_key, single_file_failed
+from journal import Journal
+from incremental import Manifest
+from results_writer import ResultsWriter, export_summary_json, iter_results
+from summary_store import SummaryStore
+from sharding import ShardQueue, partition_files, hold_claim
+from budget import SummaryBudget, rank_files, coverage_metrics
+from scheduler import ChunkFeeder, DependencyScheduler, WorkStealingPool
+from llm_client import summarize_project, summarize_chunk, summarize_single_chunk_file
+from llm_client import build_chunk_messages, build_method_messages, build_single_file_messages
+from batch_client import batch_client
+from async_summarizer import AsyncSummarizerAgent, AsyncSharedCache
+from project_reducer import ProjectReducer, AsyncProjectReducer
+from async_llm_client import summarize_project_async, async_transport
 
 
 class SimpleSummarizer:
-    def __init__(self, project_dir):
+    def __init__(self, project_dir, resume=False, incremental=False, shard_count=1, shard=None, budget=None):
         self.project_dir = project_dir
-        self.shared_cache = SharedCache()
-        
-    def run(self):
-        print(f"Starting analysis of {self.project_dir}")
-        stats.start_timing()
-        
-        analyzer = CodeAnalyzer(
-            PROJECT_CONFIG["supported_extensions"],
-            PROJECT_CONFIG["exclude_patterns"], 
-            PROJECT_CONFIG["include_test_files"]
+        self.resume = resume
+        self.incremental = incremental
+        self.shard_count = shard_count
+        # a SummaryBudget limits the run to the most central files it can pay for
+        self.budget = budget
+        # (id, files) when a worker runs one shard of the project
+        self.shard = shard
+        self.run_name = os.path.basename(project_dir)
+        if shard is not None:
+            self.run_name += f".shard{shard[0]}"
+
+        self.journal = Journal(
+            os.path.join(SUMMARIZER_CONFIG["journal_dir"], f"{self.run_name}.jsonl"),
+            resume
         )
-        
-        java_files = analyzer.analyze_project(self.project_dir)
-        print(f"Found {len(java_files)} Java files")
-        
-        chunker = Chunker(
+        self.manifest = Manifest(
+            os.path.join(SUMMARIZER_CONFIG["manifest_dir"], f"{os.path.basename(project_dir)}.json"),
+            project_dir,
+            incremental
+        )
+        store = None
+        if shard is None:
+            results_file = os.path.join(SUMMARIZER_CONFIG["results_dir"], f"summary_{self.run_name}")
+            if SUMMARIZER_CONFIG["summary_store"]:
+                store = SummaryStore(results_file + ".sqlite", reset=True)
+        else:
+            results_file = os.path.join(SUMMARIZER_CONFIG["results_dir"], "shards", f"summary_{self.run_name}")
+        self.writer = ResultsWriter(
+            results_file + (".jsonl.gz" if SUMMARIZER_CONFIG["compress_results"] else ".jsonl"),
+            store
+        )
+        self.stop_requested = threading.Event()
+        self.chunker = Chunker(
             CHUNKING_CONFIG["window_size"],
             CHUNKING_CONFIG["overlap_size"],
             CHUNKING_CONFIG["min_chunk_size"],
             CHUNKING_CONFIG["respect_boundaries"]
         )
+        self.shared_cache = SharedCache(
+            SUMMARIZER_CONFIG["method_cache_max_bytes"],
+            SUMMARIZER_CONFIG["method_cache_admission"],
+            SUMMARIZER_CONFIG["cache_wait_timeout"]
+        )
         
-        chunks = chunker.create_chunks(java_files)
-        print(f"Created {len(chunks)} chunks")
-        
+    def run(self):
+        """Returns the project record written after the file summaries, or None when
+        a signal stopped the run early"""
+        try:
+            if self.shard_count > 1:
+                return self.run_sharded()
+
+            # only the thread scheduler admits files one at a time, which a budget needs
+            if self.budget is not None:
+                return self.run_threads()
+
+            if SUMMARIZER_CONFIG["execution_mode"] == "async":
+                return asyncio.run(self.run_async())
+
+            if SUMMARIZER_CONFIG["execution_mode"] == "batch":
+                return self.run_batch()
+
+            return self.run_threads()
+        finally:
+            self.writer.close()
+            # a shard's manifest entries reach the manifest through the coordinator
+            if self.shard is None:
+                self.manifest.save()
+            self.journal.close()
+
+    def run_threads(self):
+        print(f"Starting analysis of {self.project_dir}")
+        stats.start_timing()
+        java_files = self._discover()
+
+        # only discovery runs up front: chunks stream to the workers file by file,
+        # the dependency index fills in lazily and a background thread reads ahead
         dependency_detector = DependencyDetector(java_files)
-        shared_file_summaries = {}
-        
-        file_chunk_counts = defaultdict(int)
-        for chunk in chunks:
-            file_chunk_counts[chunk['file_path']] += 1
-        
-        summarizer_agents = []
-        for i in range(SUMMARIZER_CONFIG["max_workers"]):
-            agent = SummarizerAgent(
-                dependency_detector, 
-                self.shared_cache,
-                SUMMARIZER_CONFIG["max_dependency_context"],
-                shared_file_summaries
+        threading.Thread(target=dependency_detector.warm_index, name="indexer", daemon=True).start()
+        files_to_summarize, reused_summaries = self.manifest.plan(self._own_files(java_files), dependency_detector)
+
+        agent, finalizer = self._create_agent(dependency_detector, {}, java_files, reused_summaries)
+        pool = WorkStealingPool(SUMMARIZER_CONFIG["max_workers"])
+        if SUMMARIZER_CONFIG["dependency_scheduling"]:
+            feeder = DependencyScheduler(
+                pool,
+                agent,
+                SUMMARIZER_CONFIG["max_pending_chunks"],
+                self.stop_requested,
+                dependency_detector,
+                SUMMARIZER_CONFIG["max_dependency_context"]
             )
-            summarizer_agents.append(agent)
-        
-        # Set expected chunks for all agents
-        for agent in summarizer_agents:
-            for file_path, count in file_chunk_counts.items():
-                agent.set_expected_chunks(file_path, count)
-        
-        print(f"Processing chunks with {len(summarizer_agents)} workers...")
-        
-        # Group chunks by file
-        chunks_by_file = defaultdict(list)
-        for chunk in chunks:
-            chunks_by_file[chunk['file_path']].append(chunk)
-        
-        # Assign each file to a worker
-        file_assignments = {}
-        for i, file_path in enumerate(chunks_by_file.keys()):
-            worker_index = i % len(summarizer_agents)
-            file_assignments[file_path] = worker_index
+        else:
+            feeder = ChunkFeeder(pool, agent, SUMMARIZER_CONFIG["max_pending_chunks"], self.stop_requested)
+
+        print(f"Processing chunks with {SUMMARIZER_CONFIG['max_workers']} workers...")
+
+        if self.budget is not None:
+            # the most central files first, so whatever the budget covers matters most
+            ranked_files, centrality = rank_files(java_files, dependency_detector, self._file_size)
+            pending_files = set(files_to_summarize)
+            ordered_files = [file_path for file_path in ranked_files if file_path in pending_files]
+        else:
+            # larger files first, so the longest files are not the last to start;
+            # each gets a home worker and idle workers steal whatever is queued elsewhere
+            ordered_files = sorted(files_to_summarize, key=self._file_size, reverse=True)
+        chunks = []
+        admitted_files = set()
+        stopped_by = None
+        previous_handlers = self._handle_stop_signals()
+        try:
+            for file_path, file_chunks in self.chunker.iter_file_chunks(ordered_files):
+                if self.stop_requested.is_set():
+                    break
+                if self.budget is not None:
+                    over_budget = self._wait_for_budget(feeder, len(file_chunks))
+                    if over_budget is not None:
+                        stopped_by = over_budget
+                        if self.budget.exhausted(*feeder.progress()) is not None:
+                            print(f"Budget of {stopped_by} spent; leaving {len(ordered_files) - len(admitted_files)} "
+                                  f"files unsummarized")
+                            break
+                        # a smaller file further down may still fit
+                        print(f"Skipping {file_path}: its {len(file_chunks)} chunks would exceed the {stopped_by} budget")
+                        continue
+                admitted_files.add(file_path)
+                agent.completion_tracker.expect(file_path, len(file_chunks))
+                pool.assign(file_path, len(file_chunks))
+                feeder.add(file_chunks)
+                chunks.extend(file_chunks)
+            print(f"Created {len(chunks)} chunks")
+            feeder.wait()
+        finally:
+            workers = pool.shutdown()
+            for signum, handler in previous_handlers.items():
+                signal.signal(signum, handler)
+
+        stats.log_worker_utilization(workers)
+        for worker in workers:
+            print(f"Worker {worker['worker']}: {worker['tasks']} tasks, {worker['steals']} stolen, "
+                  f"{worker['utilization']:.0%} busy")
         
+        if self.stop_requested.is_set():
+            return self._stop_early(finalizer)
+
+        finalizer.drain()
+        project_summary = self._summarize_project(finalizer.reducer)
+        if self.budget is not None:
+            stats.log_coverage(coverage_metrics(
+                centrality,
+                self._file_size,
+                admitted_files | set(reused_summaries),
+                stopped_by,
+                self.budget
+            ))
+
+        return self._finish(java_files, len(chunks), project_summary)
+
+    def _wait_for_budget(self, feeder, chunk_count):
+        """None once the budget can cover a file of chunk_count chunks on top of those
+        queued; the limit it would reach when even the chunks in flight have finished
+        without leaving room for it"""
+        while True:
+            pending_chunks, completed_chunks = feeder.progress()
+            stopped_by = self.budget.exhausted(pending_chunks + chunk_count, completed_chunks)
+            # until a chunk finishes there is no cost per chunk, so only keep the workers busy
+            calibrating = completed_chunks == 0 and pending_chunks >= SUMMARIZER_CONFIG["max_workers"]
+            if self.stop_requested.is_set() or pending_chunks == 0 or (stopped_by is None and not calibrating):
+                return stopped_by
+            time.sleep(0.2)
+
+    def run_sharded(self):
+        """Coordinator: partitions the project along its call graph, lets worker processes
+        here or on other hosts summarize the shards from a shared queue, then merges
+        their file summaries and reduces the project summary"""
+        print(f"Starting sharded analysis of {self.project_dir}")
+        stats.start_timing()
+        java_files = self._discover()
+
+        queue_path = os.path.join(SUMMARIZER_CONFIG["results_dir"], f"queue_{self.run_name}.sqlite")
+        queue = ShardQueue(queue_path, SUMMARIZER_CONFIG["shard_lease_seconds"], reset=not self.resume)
+        shard_count = queue.shard_count()
+        if shard_count:
+            print(f"Resuming shard queue {queue_path} with {shard_count} shards")
+        else:
+            shard_count = queue.fill(partition_files(java_files, DependencyDetector(java_files), self.shard_count))
+        queue.close()
+
+        # spawned rather than forked, so workers open their own SQLite connections and
+        # sessions instead of inheriting this process's response cache and summary store
+        spawn = multiprocessing.get_context("spawn")
+        workers = [
+            spawn.Process(
+                target=run_worker,
+                args=(self.project_dir, queue_path, self.resume, self.incremental),
+                name=f"shard-worker-{i}"
+            )
+            for i in range(SUMMARIZER_CONFIG["shard_workers"])
+        ]
+        for worker in workers:
+            worker.start()
+        print(f"Started {len(workers)} local workers; others can join with "
+              f"main.py {self.project_dir} --worker {queue_path}")
+
+        queue = ShardQueue(queue_path, SUMMARIZER_CONFIG["shard_lease_seconds"])
+        previous_handlers = self._handle_stop_signals()
+        try:
+            finished = self._wait_for_shards(queue, shard_count, workers)
+            # stopped workers hand their shards back before exiting
+            for worker in workers:
+                worker.join()
+        finally:
+            for signum, handler in previous_handlers.items():
+                signal.signal(signum, handler)
+
+        if not finished:
+            queue.close()
+            print("Stopped before every shard finished; rerun with --resume to continue")
+            return None
+
+        for snapshot in queue.manifests():
+            self.manifest.merge(snapshot)
+
+        reducer = None
+        if SUMMARIZER_CONFIG["project_reduction"] == "hierarchical":
+            reducer = ProjectReducer(
+                self.project_dir,
+                java_files,
+                SUMMARIZER_CONFIG["reduce_fan_in"],
+                SUMMARIZER_CONFIG["max_workers"],
+                self.journal,
+                self.manifest
+            )
+        for file_path, file_summary, file_hash in queue.results():
+            self.writer.add_file(file_path, file_summary, file_hash)
+            if reducer is not None:
+                reducer.add_file(file_path, file_summary)
+        chunk_count = queue.total_chunks()
+        queue.close()
+
+        project_summary = self._summarize_project(reducer)
+
+        return self._finish(java_files, chunk_count, project_summary)
+
+    def _wait_for_shards(self, queue, shard_count, workers):
+        """Returns True once every shard is done, or False when a signal stops the wait.
+        Raises when no worker is left to finish the remaining shards"""
+        reported = None
+        while not self.stop_requested.is_set():
+            done, running, claimable = queue.progress()
+            if (done, running) != reported:
+                print(f"Shards done: {done}/{shard_count}, {running} running")
+                reported = (done, running)
+            if done == shard_count:
+                return True
+
+            workers_gone = workers and not any(worker.is_alive() for worker in workers)
+            if running == 0 and (claimable == 0 or workers_gone):
+                raise RuntimeError(
+                    f"{shard_count - done} shards left unfinished with no worker to run them; "
+                    f"rerun with --resume to retry"
+                )
+            time.sleep(1)
+        return False
+
+    def _handle_stop_signals(self):
+        """First SIGINT or SIGTERM stops taking new work and lets requests in flight
+        finish; a second one interrupts immediately"""
+        def request_stop(signum, frame):
+            if self.stop_requested.is_set():
+                raise KeyboardInterrupt
+            print(f"Received {signal.Signals(signum).name}, finishing requests in flight (signal again to abort)...")
+            self.stop_requested.set()
+
+        previous_handlers = {}
+        for signum in (signal.SIGINT, signal.SIGTERM):
+            previous_handlers[signum] = signal.signal(signum, request_stop)
+        return previous_handlers
+
+    def _stop_early(self, finalizer):
+        summarized_files = finalizer.drain()
+        if finalizer.reducer is not None:
+            finalizer.reducer.close()
+        print(f"Stopped early with {summarized_files} file summaries journaled; "
+              f"rerun with --resume to continue")
+        return None
+
+    def run_batch(self):
+        java_files, chunks, dependency_detector, chunks_by_file, reused_summaries = self._prepare()
+
+        agent, finalizer = self._create_agent(dependency_detector, chunks_by_file, java_files, reused_summaries)
+        # a batch already submitted is still waited for, since it is billed either way;
+        # a stop only keeps the next phase from starting
+        previous_handlers = self._handle_stop_signals()
+        try:
+            return self._run_batch_phases(java_files, chunks, dependency_detector, agent, finalizer)
+        finally:
+            for signum, handler in previous_handlers.items():
+                signal.signal(signum, handler)
+
+    def _run_batch_phases(self, java_files, chunks, dependency_detector, agent, finalizer):
+
+        # chunks already in the journal or manifest need neither dependencies nor a request
+        chunk_summaries = {}
+        known_file_summaries = set()
+        for i, chunk in enumerate(chunks):
+            known, is_file_summary = agent.known_chunk_summary(chunk)
+            if known is not None:
+                chunk_summaries[i] = known
+                if is_file_summary:
+                    known_file_summaries.add(i)
+
+        # Resolve every chunk's dependencies up front so the method prompts
+        # can go out as one set of batches
+        chunk_dependencies = {}
+        method_prompts = {}
+        method_keys = {}
+        for i, chunk in enumerate(chunks):
+            if i in chunk_summaries:
+                continue
+            dependencies = dependency_detector.find_dependencies(chunk)
+            chunk_dependencies[i] = dependencies
+
+            for dep in dependencies[:SUMMARIZER_CONFIG["max_dependency_context"]]:
+                key = dependency_key(dep)
+                if key in method_prompts or key in method_keys:
+                    continue
+
+                method_content = dependency_detector.extract_method_from_file(dep['file_path'], dep['method_name'])
+                method_keys[key] = (method_journal_key(dep, method_content), dep['file_path'])
+                journaled = self.journal.get("method", method_keys[key][0])
+                if journaled is not None:
+                    self.shared_cache.put(key, journaled)
+                else:
+                    method_prompts[key] = build_method_messages(method_content, dep['file_path'], dep['method_name'])
+
+        print(f"Submitting {len(method_prompts)} method summaries in batch mode...")
+        for key, method_summary in batch_client.run(method_prompts, "method_summary").items():
+            self.shared_cache.put(key, method_summary)
+            journal_key, file_path = method_keys[key]
+            self.journal.record("method", journal_key, method_summary, file_path)
+        if self.stop_requested.is_set():
+            return self._stop_early(finalizer)
+
+        # Methods missing from the batch results go to the live API here, across the
+        # workers; the shared cache runs each of them once
+        with ThreadPoolExecutor(max_workers=SUMMARIZER_CONFIG["max_workers"]) as executor:
+            chunk_contexts = dict(zip(
+                chunk_dependencies,
+                executor.map(lambda i: agent.build_chunk_context(chunks[i], chunk_dependencies[i]), chunk_dependencies)
+            ))
+
+        chunk_prompts = {}
+        # files of one chunk get their file summary from a single prompt
+        single_file_prompts = {}
+        for i, context in chunk_contexts.items():
+            if agent.is_single_chunk_file(chunks[i]):
+                single_file_prompts[i] = build_single_file_messages(chunks[i]['content'], context, chunks[i]['file_path'])
+            else:
+                chunk_prompts[i] = build_chunk_messages(chunks[i]['content'], context)
+
+        if self.stop_requested.is_set():
+            return self._stop_early(finalizer)
+
+        print(f"Submitting {len(chunk_prompts)} chunk summaries in batch mode...")
+        for i, chunk_summary in batch_client.run(chunk_prompts, "chunk_summary").items():
+            chunk_summaries[i] = chunk_summary
+            agent.store_chunk_summary(chunks[i], chunk_summary, chunk_dependencies[i])
+
+        if self.stop_requested.is_set():
+            return self._stop_early(finalizer)
+
+        print(f"Submitting {len(single_file_prompts)} single chunk file summaries in batch mode...")
+        single_file_results = batch_client.run(single_file_prompts, "single_file_summary", "single_chunk_file")
+        for i, file_summary in single_file_results.items():
+            chunk_summaries[i] = file_summary
+            agent.store_chunk_summary(chunks[i], file_summary, chunk_dependencies[i], True)
+
+        def finish_chunk(i):
+            if self.stop_requested.is_set():
+                return None
+            chunk = chunks[i]
+            is_file_summary = i in single_file_prompts or i in known_file_summaries
+            chunk_summary = chunk_summaries.get(i)
+            if chunk_summary is None and is_file_summary:
+                chunk_summary = summarize_single_chunk_file(chunk['content'], chunk_contexts[i], chunk['file_path'])
+                is_file_summary = not single_file_failed(chunk, chunk_summary)
+                if is_file_summary:
+                    agent.store_chunk_summary(chunk, chunk_summary, chunk_dependencies[i], True)
+                else:
+                    chunk_summary = None
+            if chunk_summary is None:
+                chunk_summary = summarize_chunk(chunk['content'], chunk_contexts[i])
+                agent.store_chunk_summary(chunk, chunk_summary, chunk_dependencies[i])
+
+            return agent.record_chunk_summary(chunk, chunk_summary, is_file_summary)
+
         with ThreadPoolExecutor(max_workers=SUMMARIZER_CONFIG["max_workers"]) as executor:
-            futures = []
-            
-            for file_path, file_chunks in chunks_by_file.items():
-                print("Processing file:", file_path)
-                worker_index = file_assignments[file_path]
-                agent = summarizer_agents[worker_index]
-                
-                for chunk in file_chunks:
-                    future = executor.submit(agent.process_chunk, chunk)
-                    futures.append(future)
-            
-            completed_chunks = 0
-            for future in futures:
-                chunk_summary, file_summary = future.result()
+            list(executor.map(finish_chunk, range(len(chunks))))
+
+        if self.stop_requested.is_set():
+            return self._stop_early(finalizer)
+
+        finalizer.drain()
+        project_summary = self._summarize_project(finalizer.reducer)
+
+        return self._finish(java_files, len(chunks), project_summary)
+
+    async def run_async(self):
+        java_files, chunks, dependency_detector, chunks_by_file, reused_summaries = self._prepare()
+        reducer = None
+        if SUMMARIZER_CONFIG["project_reduction"] == "hierarchical" and self.shard is None:
+            reducer = AsyncProjectReducer(
+                self.project_dir,
+                java_files,
+                SUMMARIZER_CONFIG["reduce_fan_in"],
+                self.journal,
+                self.manifest
+            )
+        self._add_reused_files(reused_summaries, reducer)
+
+        agent = AsyncSummarizerAgent(
+            dependency_detector,
+            AsyncSharedCache(
+                SUMMARIZER_CONFIG["method_cache_max_bytes"],
+                SUMMARIZER_CONFIG["method_cache_admission"],
+                SUMMARIZER_CONFIG["cache_wait_timeout"]
+            ),
+            SUMMARIZER_CONFIG["max_dependency_context"],
+            self.writer,
+            {file_path: len(file_chunks) for file_path, file_chunks in chunks_by_file.items()},
+            self.journal,
+            self.manifest,
+            SUMMARIZER_CONFIG["reduce_fan_in"],
+            reducer,
+            SUMMARIZER_CONFIG["single_chunk_fast_path"]
+        )
+
+        print(f"Processing chunks with up to {SUMMARIZER_CONFIG['max_in_flight']} requests in flight...")
+
+        previous_handlers = self._handle_stop_signals()
+        try:
+            await self._process_chunks_async(agent, chunks)
+            if self.stop_requested.is_set():
+                # sections still running finish; the package reductions are cheap to redo
+                await asyncio.gather(*[task for tasks in agent.section_tasks.values() for task in tasks], return_exceptions=True)
+                if reducer is not None:
+                    await reducer.close()
+                print(f"Stopped early with {self.writer.file_count} file summaries journaled; "
+                      f"rerun with --resume to continue")
+                return None
+
+            project_summary = None
+            if reducer is not None:
+                project_summary = await reducer.finish()
+            elif self.shard is None:
+                file_summaries = self.writer.file_summaries()
+                project_summary = self.manifest.reusable_project_summary(file_summaries)
+                if project_summary is None:
+                    project_summary = await summarize_project_async(
+                        list(file_summaries.values()),
+                        self.project_dir
+                    )
+                    self.manifest.record_project(file_summaries, project_summary)
+        finally:
+            for signum, handler in previous_handlers.items():
+                signal.signal(signum, handler)
+            await async_transport.close()
+
+        return self._finish(java_files, len(chunks), project_summary)
+
+    async def _process_chunks_async(self, agent, chunks):
+        """Keeps up to max_pending_chunks chunks in progress and starts no new one once
+        a stop is requested, waiting only for those already started"""
+        remaining = iter(chunks)
+        pending = set()
+        completed_chunks = 0
+        while True:
+            while not self.stop_requested.is_set() and len(pending) < SUMMARIZER_CONFIG["max_pending_chunks"]:
+                chunk = next(remaining, None)
+                if chunk is None:
+                    break
+                pending.add(asyncio.ensure_future(agent.process_chunk(chunk)))
+            if not pending:
+                return
+
+            # the timeout lets a stop signal be noticed between completions
+            done, pending = await asyncio.wait(pending, timeout=0.5, return_when=asyncio.FIRST_COMPLETED)
+            for task in done:
+                task.result()
                 completed_chunks += 1
-                
+
                 if completed_chunks % 10 == 0:
                     memory_usage = psutil.Process().memory_info().rss / 1024 / 1024
                     print(f"Processed {completed_chunks}/{len(chunks)} chunks - Memory: {memory_usage:.1f}MB")
-                
-                if file_summary:
-                    print(f"Completed file summary for a file")
+
+    def _prepare(self):
+        print(f"Starting analysis of {self.project_dir}")
+        stats.start_timing()
         
-        all_file_summaries = shared_file_summaries
+        java_files = self._discover()
+        dependency_detector = DependencyDetector(java_files)
+        files_to_summarize, reused_summaries = self.manifest.plan(self._own_files(java_files), dependency_detector)
+
+        chunks = self.chunker.create_chunks(files_to_summarize)
+        print(f"Created {len(chunks)} chunks")
         
-        print(f"Generated summaries for {len(all_file_summaries)} files")
+        # Group chunks by file
+        chunks_by_file = defaultdict(list)
+        for chunk in chunks:
+            chunks_by_file[chunk['file_path']].append(chunk)
+
+        return java_files, chunks, dependency_detector, chunks_by_file, reused_summaries
+
+    def _discover(self):
+        analyzer = CodeAnalyzer(
+            PROJECT_CONFIG["supported_extensions"],
+            PROJECT_CONFIG["exclude_patterns"], 
+            PROJECT_CONFIG["include_test_files"]
+        )
         
-        project_summary = summarize_project(
-            list(all_file_summaries.values()), 
-            self.project_dir
+        java_files = analyzer.analyze_project(self.project_dir)
+        print(f"Found {len(java_files)} Java files")
+        return java_files
+
+    def _own_files(self, java_files):
+        """The files this run summarizes: every one, or those of a worker's shard.
+        The rest still serve as dependency context"""
+        if self.shard is None:
+            return java_files
+        shard_files = set(self.shard[1])
+        return [file_path for file_path in java_files if file_path in shard_files]
+
+    def _file_size(self, file_path):
+        try:
+            return os.path.getsize(file_path)
+        except OSError:
+            return 0
+
+    def _summarize_project(self, reducer=None):
+        """The reduced package tree's summary, or with flat reduction the last run's
+        project summary if no file summary moved, else a new one. A shard has none"""
+        if reducer is not None:
+            return reducer.finish()
+        if self.shard is not None:
+            return None
+
+        # flat reduction needs every summary at once; read them back from the results stream
+        file_summaries = self.writer.file_summaries()
+        project_summary = self.manifest.reusable_project_summary(file_summaries)
+        if project_summary is None:
+            project_summary = summarize_project(list(file_summaries.values()), self.project_dir)
+            self.manifest.record_project(file_summaries, project_summary)
+        return project_summary
+
+    def _create_agent(self, dependency_detector, chunks_by_file, java_files, reused_summaries):
+        # the agent keeps no per-worker state: the cache, completion tracker and
+        # file finalizer are shared, so any worker can process any chunk
+        completion_tracker = CompletionTracker(
+            {file_path: len(file_chunks) for file_path, file_chunks in chunks_by_file.items()},
+            SUMMARIZER_CONFIG["reduce_fan_in"]
+        )
+
+        reducer = None
+        if SUMMARIZER_CONFIG["project_reduction"] == "hierarchical" and self.shard is None:
+            reducer = ProjectReducer(
+                self.project_dir,
+                java_files,
+                SUMMARIZER_CONFIG["reduce_fan_in"],
+                SUMMARIZER_CONFIG["max_workers"],
+                self.journal,
+                self.manifest
+            )
+        self._add_reused_files(reused_summaries, reducer)
+
+        finalizer = FileFinalizer(
+            SUMMARIZER_CONFIG["max_workers"],
+            self.writer,
+            self.journal,
+            self.manifest,
+            SUMMARIZER_CONFIG["reduce_fan_in"],
+            reducer
+        )
+
+        agent = SummarizerAgent(
+            dependency_detector, 
+            self.shared_cache,
+            SUMMARIZER_CONFIG["max_dependency_context"],
+            completion_tracker,
+            finalizer,
+            self.journal,
+            self.manifest,
+            SUMMARIZER_CONFIG["single_chunk_fast_path"]
         )
 
+        return agent, finalizer
+
+    def _add_reused_files(self, reused_summaries, reducer):
+        """Summaries an incremental run kept from the last one go out like new ones"""
+        for file_path, file_summary in reused_summaries.items():
+            self.writer.add_file(file_path, file_summary, self.manifest.content_hash(file_path))
+            if reducer is not None:
+                reducer.add_file(file_path, file_summary)
+
+    def _finish(self, java_files, chunk_count, project_summary):
+        print(f"Generated summaries for {self.writer.file_count} files")
+
         stats.end_timing()
 
-        project_name = os.path.basename(self.project_dir)
-        stats_file = stats.export_stats(project_name)
+        stats_file = stats.export_stats(self.run_name)
         print(f"\n\nStats exported to: {stats_file}")
 
-        return {
-            'project_summary': project_summary,
-            'file_summaries': all_file_summaries,
-            'total_files': len(java_files),
-            'total_chunks': len(chunks),
-            'project_path': self.project_dir
-        }
+        return self.writer.finish(project_summary, len(java_files), chunk_count, self.project_dir)
+
+
+def run_worker(project_dir, queue_path, resume=False, incremental=False):
+    """Summarizes shards from a coordinator's queue until none is left to claim.
+    project_dir must be the path the coordinator was given, since it keys every file"""
+    queue = ShardQueue(queue_path, SUMMARIZER_CONFIG["shard_lease_seconds"])
+    worker = f"{socket.gethostname()}:{os.getpid()}"
+    try:
+        while True:
+            shard = queue.claim(worker)
+            if shard is None:
+                break
+            shard_id, shard_files = shard
+            print(f"Worker {worker} took shard {shard_id} with {len(shard_files)} files")
+
+            stats.reset()
+            claim_released = threading.Event()
+            heartbeat = threading.Thread(
+                target=hold_claim,
+                args=(queue_path, SUMMARIZER_CONFIG["shard_lease_seconds"], shard_id, worker, claim_released),
+                name="heartbeat",
+                daemon=True
+            )
+            heartbeat.start()
+            try:
+                summarizer = SimpleSummarizer(project_dir, resume, incremental, shard=shard)
+                record = summarizer.run()
+            except Exception as e:
+                print(f"Shard {shard_id} failed on {worker}: {e!r}")
+                queue.release(shard_id, worker, failed=True)
+                continue
+            finally:
+                claim_released.set()
+                heartbeat.join()
+
+            if record is None:
+                queue.release(shard_id, worker, failed=False)
+                break
+
+            queue.complete(
+                shard_id,
+                [
+                    (result['path'], result['summary'], result.get('content_hash'))
+                    for result in iter_results(summarizer.writer.path) if result['type'] == 'file'
+                ],
+                record['total_chunks'],
+                summarizer.manifest.snapshot()
+            )
+    finally:
+        queue.close()
 
 
 def main():
-    project_dir = "research/experiments/hive" #input("Enter project directory path: ").strip()
+    parser = argparse.ArgumentParser(description="Summarize a Java project")
+    parser.add_argument("project_dir", nargs="?", default="research/experiments/hive")
+    parser.add_argument("--resume", action="store_true", help="skip work already in this project's journal")
+    parser.add_argument("--incremental", action="store_true",
+                        help="reuse the last run's summaries for code and dependencies that have not changed")
+    parser.add_argument("--shards", type=int, default=1,
+                        help="split the project along its call graph into this many shards for worker processes")
+    parser.add_argument("--worker", metavar="QUEUE",
+                        help="summarize shards from a coordinator's queue_<project>.sqlite, then exit")
+    parser.add_argument("--budget-calls", type=int,
+                        help="stop taking on files once this many API requests are sent")
+    parser.add_argument("--budget-tokens", type=int, help="stop taking on files once this many tokens are billed")
+    parser.add_argument("--budget-minutes", type=float, help="stop taking on files after this many minutes")
+    args = parser.parse_args()
+    project_dir = args.project_dir
+
+    budget = None
+    if args.budget_calls is not None or args.budget_tokens is not None or args.budget_minutes is not None:
+        if args.shards > 1 or args.worker:
+            parser.error("a budget applies to a single process run, not to --shards or --worker")
+        budget = SummaryBudget(args.budget_calls, args.budget_tokens, args.budget_minutes)
     
     if not os.path.exists(project_dir):
         print(f"Directory {project_dir} does not exist")
         return
+
+    if args.worker:
+        run_worker(project_dir, args.worker, args.resume, args.incremental)
+        return
     
-    summarizer = SimpleSummarizer(project_dir)
+    summarizer = SimpleSummarizer(project_dir, args.resume, args.incremental, args.shards, budget=budget)
     results = summarizer.run()
+    if results is None:
+        return
 
-    output_file = f"results/summary_{os.path.basename(project_dir)}.json"
-    with open(output_file, 'w', encoding='utf-8') as f:
-        json.dump(results, f, indent=2, ensure_ascii=False)
+    print(f"File summaries streamed to {summarizer.writer.path}")
+    if summarizer.writer.store is not None:
+        print(f"Summary store written to {summarizer.writer.store.path}")
+    if SUMMARIZER_CONFIG["export_summary_json"]:
+        output_file = os.path.join(SUMMARIZER_CONFIG["results_dir"], f"summary_{os.path.basename(project_dir)}.json")
+        export_summary_json(summarizer.writer.path, output_file)
+        print(f"Exported {output_file}")
+        if summarizer.writer.store is not None:
+            # the store already holds this run, so readers given the json open it as is
+            os.utime(summarizer.writer.store.path)
     
     print("\n" + "="*80)
     print("PROJECT SUMMARY")
@@ -145,7 +752,7 @@ def main():
     print(results['project_summary'])
     
     print(f"\nProcessed {results['total_files']} files in {results['total_chunks']} chunks")
-    print(f"Generated {len(results['file_summaries'])} file summaries")
+    print(f"Generated {results['summarized_files']} file summaries")
 
 
 if __name__ == "__main__":
@@ -0,0 +1,136 @@
+"""Local stand-in for the Anthropic Messages and Message Batches endpoints.
+
+Point CLAUDE_CONFIG["base_url"] at it to exercise the pipeline without
+spending API credits:
+
+    python mock_api_server.py --port 8089 --batch-delay 2
+"""
+import re
+import json
+import time
+import uuid
+import argparse
+import threading
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+
+
+def fake_message(params):
+    prompt = params["messages"][-1]["content"]
+    if isinstance(prompt, list):
+        prompt = " ".join(block.get("text", "") for block in prompt)
+
+    first_line = prompt.strip().split('\n')[0]
+    text = f"Mock summary ({len(prompt)} prompt chars): {first_line}"
+    return {
+        "id": f"msg_{uuid.uuid4().hex[:12]}",
+        "type": "message",
+        "role": "assistant",
+        "model": params.get("model"),
+        "content": [{"type": "text", "text": text}],
+        "stop_reason": "end_turn",
+        "usage": {"input_tokens": len(prompt) // 4, "output_tokens": len(text) // 4}
+    }
+
+
+class MockState:
+    def __init__(self, batch_delay):
+        self.batch_delay = batch_delay
+        self.batches = {}
+        self.lock = threading.Lock()
+
+
+class MockHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    state = None
+
+    def do_POST(self):
+        body = self._read_json()
+
+        if self.path == "/v1/messages":
+            self._send_json(200, fake_message(body))
+        elif self.path == "/v1/messages/batches":
+            batch_id = f"msgbatch_{uuid.uuid4().hex[:12]}"
+            with self.state.lock:
+                self.state.batches[batch_id] = {
+                    "requests": body["requests"],
+                    "created": time.time()
+                }
+            self._send_json(200, self._batch_status(batch_id))
+        else:
+            self._send_json(404, {"error": {"type": "not_found_error", "message": self.path}})
+
+    def do_GET(self):
+        match = re.fullmatch(r"/v1/messages/batches/(\w+)(/results)?", self.path)
+        if not match or match.group(1) not in self.state.batches:
+            self._send_json(404, {"error": {"type": "not_found_error", "message": self.path}})
+            return
+
+        batch_id = match.group(1)
+        if not match.group(2):
+            self._send_json(200, self._batch_status(batch_id))
+            return
+
+        lines = []
+        for request in self.state.batches[batch_id]["requests"]:
+            lines.append(json.dumps({
+                "custom_id": request["custom_id"],
+                "result": {"type": "succeeded", "message": fake_message(request["params"])}
+            }))
+        self._send_bytes(200, "application/x-jsonl", ('\n'.join(lines) + '\n').encode('utf-8'))
+
+    def _batch_status(self, batch_id):
+        batch = self.state.batches[batch_id]
+        ended = time.time() - batch["created"] >= self.state.batch_delay
+        total = len(batch["requests"])
+        host = self.headers.get("Host")
+
+        return {
+            "id": batch_id,
+            "type": "message_batch",
+            "processing_status": "ended" if ended else "in_progress",
+            "request_counts": {
+                "processing": 0 if ended else total,
+                "succeeded": total if ended else 0,
+                "errored": 0,
+                "canceled": 0,
+                "expired": 0
+            },
+            "results_url": f"http://{host}/v1/messages/batches/{batch_id}/results" if ended else None
+        }
+
+    def _read_json(self):
+        length = int(self.headers.get("Content-Length", 0))
+        return json.loads(self.rfile.read(length) or b"{}")
+
+    def _send_json(self, status, body):
+        self._send_bytes(status, "application/json", json.dumps(body).encode('utf-8'))
+
+    def _send_bytes(self, status, content_type, data):
+        self.send_response(status)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def log_message(self, format, *args):
+        pass
+
+
+def serve(port, batch_delay):
+    MockHandler.state = MockState(batch_delay)
+    server = ThreadingHTTPServer(("127.0.0.1", port), MockHandler)
+    print(f"Mock API listening on http://127.0.0.1:{port}")
+    server.serve_forever()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Mock Anthropic API for local testing")
+    parser.add_argument("--port", type=int, default=8089)
+    parser.add_argument("--batch-delay", type=float, default=2.0, help="seconds before a batch reports ended")
+    args = parser.parse_args()
+
+    serve(args.port, args.batch_delay)
+
+
+if __name__ == "__main__":
+    main()
@@ -2,55 +2,135 @@ import time
 import json
 import requests
 
-from config import OPENAI_CONFIG
+from config import OPENAI_CONFIG, RESILIENCE_CONFIG
+from stats_collector import stats
+from transport import transport
+from response_cache import response_cache
+from llm_client import RateLimiter, oversized_prompt_error, record_token_counts
+from token_budget import openai_budget
+from circuit_breaker import openai_breaker, retry_wait
 
 
-def call_openai_with_backoff(messages, max_retries=10, api_key=OPENAI_CONFIG["api_key"]):
+openai_rate_limiter = RateLimiter(
+    OPENAI_CONFIG["requests_per_minute"],
+    OPENAI_CONFIG["input_tokens_per_minute"],
+    OPENAI_CONFIG["output_tokens_per_minute"]
+)
+
+
+def normalize_usage(usage):
+    """Map an openai usage block onto the anthropic field names StatsCollector records"""
+    prompt_tokens = usage.get("prompt_tokens", 0)
+    cached_tokens = (usage.get("prompt_tokens_details") or {}).get("cached_tokens", 0)
+
+    return {
+        "input_tokens": prompt_tokens - cached_tokens,
+        "output_tokens": usage.get("completion_tokens", 0),
+        "cache_read_input_tokens": cached_tokens
+    }
+
+
+def call_openai_with_backoff(messages, max_retries=RESILIENCE_CONFIG["max_attempts"], api_key=OPENAI_CONFIG["api_key"], category=None):
+    payload = {
+        "model": OPENAI_CONFIG["model"],
+        "max_completion_tokens": OPENAI_CONFIG["max_tokens"],
+        "temperature": OPENAI_CONFIG["temperature"],
+        "messages": messages
+    }
+    predicted_tokens = openai_budget.count_payload(payload)
+    error = oversized_prompt_error(predicted_tokens, openai_budget)
+    if error:
+        print(error)
+        return error
+
+    cache_key = response_cache.make_key(payload)
+    cached = response_cache.get(cache_key)
+    if cached is not None:
+        return cached
+
+    openai_breaker.record_request()
+    last_error = "no attempt made"
+    rate_limited = False
+
     for attempt in range(max_retries):
+        if attempt > 0 and not rate_limited and not openai_breaker.allow_retry():
+            return f"error: retry budget exhausted after {attempt} attempts: {last_error}"
+        if not openai_breaker.allow_request():
+            return f"error: openai circuit breaker is open: {last_error}"
+
+        rate_limited = False
         try:
             headers = {
                 "Content-Type": "application/json",
                 "Authorization": f"Bearer {api_key}"
             }
             
-            payload = {
-                "model": OPENAI_CONFIG["model"],
-                "max_completion_tokens": OPENAI_CONFIG["max_tokens"],
-                "temperature": OPENAI_CONFIG["temperature"],
-                "messages": messages
-            }
+            openai_rate_limiter.acquire(predicted_tokens)
+            started = time.monotonic()
             
-            response = requests.post(
+            response = transport.post_adaptive(
                 "https://api.openai.com/v1/chat/completions",
-                headers=headers,
-                json=payload,
-                timeout=60
+                headers,
+                payload,
+                category,
+                predicted_tokens,
+                openai_rate_limiter
             )
+        except requests.exceptions.RequestException as e:
+            openai_breaker.record_failure()
+            last_error = str(e)
+        except Exception:
+            # anything unexpected still resolves a half-open probe before it propagates
+            openai_breaker.record_failure()
+            raise
+        except BaseException:
+            # interrupted rather than failed, but the probe slot must not stay taken
+            openai_breaker.release_probe()
+            raise
+        else:
+            openai_rate_limiter.update_from_headers(response.headers)
             
             if response.status_code == 200:
-                result = response.json()
-                return result["choices"][0]["message"]["content"]
+                try:
+                    result = response.json()
+                    text = result["choices"][0]["message"]["content"]
+                except (ValueError, KeyError, IndexError, TypeError) as e:
+                    # a body we cannot read is as good as no answer, so retry it
+                    openai_breaker.record_failure()
+                    last_error = f"malformed response: {e!r}"
+                else:
+                    openai_breaker.record_success()
+                    usage = normalize_usage(result.get("usage", {}))
+                    openai_rate_limiter.record_usage(result.get("usage", {}), predicted_tokens)
+                    stats.log_llm_response(category, usage, time.monotonic() - started)
+                    record_token_counts(category, usage, predicted_tokens, openai_budget)
+                    response_cache.put(cache_key, text)
+                    return text
             elif response.status_code == 429:
-                wait_time = (2 ** attempt) + (time.time() % 1)
-                print(f"rate limited, waiting {wait_time:.1f} seconds...")
-                time.sleep(wait_time)
+                openai_breaker.record_success()
+                rate_limited = True
+                if "retry-after" not in response.headers:
+                    openai_rate_limiter.pause(retry_wait(attempt))
+                print(f"rate limited, pausing all requests for {openai_rate_limiter.blocked_for():.1f} seconds...")
                 continue
+            elif response.status_code >= 500:
+                openai_breaker.record_failure()
+                last_error = f"http {response.status_code}: {response.text[:200]}"
             else:
-                response.raise_for_status()
-                
-        except requests.exceptions.RequestException as e:
-            if attempt == max_retries - 1:
-                return f"error: failed to get response after {max_retries} attempts: {str(e)}"
-            
-            wait_time = (2 ** attempt) + (time.time() % 1)
-            print(response.text)
+                openai_breaker.record_success()
+                return f"error: request rejected with http {response.status_code}: {response.text[:200]}"
+
+        if attempt < max_retries - 1:
+            wait_time = retry_wait(attempt)
             print(f"request failed (attempt {attempt + 1}), retrying in {wait_time:.1f}s...")
             time.sleep(wait_time)
     
-    return "error: max retries exceeded"
+    return f"error: failed to get response after {max_retries} attempts: {last_error}"
 
 
 def summarize_file_single_llm(file_content, file_path):
+    file_content = openai_budget.fit_text(file_content, 200)
+
     prompt = f"""Analyze this Java file and provide a comprehensive file-level summary.
 
 File: {file_path}
@@ -69,24 +149,34 @@ Provide a file summary that includes:
 Structure the summary clearly and keep it comprehensive but concise."""
 
     messages = [{"role": "user", "content": prompt}]
-    return call_openai_with_backoff(messages)
+    return call_openai_with_backoff(messages, category="baseline_file_summary")
 
 
-def judge_file_summary_openai(file_content, summary, language="Java"):
-    prompt = f"""You will be provided with a {language} file ("File") and a textual summary of it ("Summary"). The goal of the Summary is to document the functionality implemented in the File. Your role is to evaluate the Summary across three criteria, providing as output for each of them a rating and a rationale.
+def judge_instructions(language):
+    return f"""You will be provided with a {language} file ("File") and a textual summary of it ("Summary"). The goal of the Summary is to document the functionality implemented in the File. Your role is to evaluate the Summary across three criteria, providing as output for each of them a rating and a rationale.
 
 # Evaluation Criteria
 * Content adequacy: the extent to which the summary captures all important information that can be inferred from the source code.
 * Conciseness: the extent to which the summary contains unnecessary information.
 * Fluency & Understandability: the extent to which the summary is easy to read and understand.
 
-For each criterion, provide a score on a scale from 1 to 5: 1 (Very poor), 2 (Poor), 3 (Fair), 4 (Good), 5 (Very good).
+For each criterion, provide a score on a scale from 1 to 5: 1 (Very poor), 2 (Poor), 3 (Fair), 4 (Good), 5 (Very good)."""
+
 
-# File: {file_content}
+def judge_file_summary_openai(file_content, summary, language="Java"):
+    # the rubric is an identical leading system message on every call, which
+    # openai caches automatically; only the file and summary vary
+    reserved = openai_budget.count(judge_instructions(language)) + openai_budget.count(summary) + 50
+    file_content = openai_budget.fit_text(file_content, reserved)
+
+    prompt = f"""# File: {file_content}
 # Summary: {summary}"""
 
-    messages = [{"role": "user", "content": prompt}]
-    response = call_openai_with_backoff(messages)
+    messages = [
+        {"role": "system", "content": judge_instructions(language)},
+        {"role": "user", "content": prompt}
+    ]
+    response = call_openai_with_backoff(messages, category="judge")
     scores = extract_scores(response)
     
     return {
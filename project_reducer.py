@@ -0,0 +1,260 @@
+import os
+import asyncio
+import threading
+from concurrent.futures import ThreadPoolExecutor, Future
+
+from journal import content_hash
+from llm_client import summarize_package, summarize_project
+from async_llm_client import summarize_package_async, summarize_project_async
+
+
+class PackageNode:
+    def __init__(self, label, parent, slot, size):
+        self.label = label
+        self.parent = parent
+        self.slot = slot
+        # (name, summary) per input; the summary is None for inputs that produced nothing
+        self.inputs = [None] * size
+        self.waiting = size
+
+
+class PackageTree:
+    """The project's directories as a tree of summary nodes, each taking at most
+    fan_in inputs: directories with more files and subdirectories than that are
+    split into sections. A node becomes ready once every input has arrived, so
+    packages reduce while files elsewhere are still being summarized"""
+
+    def __init__(self, project_dir, file_paths, fan_in):
+        self.project_dir = project_dir
+        self.fan_in = max(fan_in, 2)
+        self.lock = threading.Lock()
+        self.file_slots = {}
+        entries = [(os.path.relpath(file_path, project_dir).split(os.sep), file_path) for file_path in file_paths]
+        self.root = self._attach(project_dir, self._directory_items(entries, ""), None, 0)
+
+    def _directory_items(self, entries, prefix):
+        """Files and subdirectories of one directory, as ("file", path) and ("dir", label, items);
+        entries pair each file's remaining path parts with its path"""
+        files = []
+        subdirectories = {}
+        for parts, file_path in entries:
+            if len(parts) == 1:
+                files.append(("file", file_path))
+            else:
+                subdirectories.setdefault(parts[0], []).append((parts[1:], file_path))
+
+        items = sorted(files)
+        for name, subdirectory_entries in sorted(subdirectories.items()):
+            label = os.path.join(prefix, name)
+            items.append(("dir", label, self._directory_items(subdirectory_entries, label)))
+        return items
+
+    def _attach(self, label, items, parent, slot):
+        while len(items) > self.fan_in:
+            items = [("section", items[i:i + self.fan_in]) for i in range(0, len(items), self.fan_in)]
+
+        node = PackageNode(label, parent, slot, len(items))
+        for i, item in enumerate(items):
+            if item[0] == "file":
+                self.file_slots[item[1]] = (node, i)
+            elif item[0] == "dir":
+                self._attach(item[1], item[2], node, i)
+            else:
+                self._attach(f"{label} (part {i + 1})", item[1], node, i)
+        return node
+
+    def initially_ready(self):
+        """Only the root of a project without files starts with nothing to wait for"""
+        return [self.root] if self.root.waiting == 0 else []
+
+    def add_file(self, file_path, summary):
+        """Returns the nodes this file completed"""
+        slot = self.file_slots.pop(file_path, None)
+        if slot is None:
+            return []
+        node, i = slot
+        name = os.path.relpath(file_path, self.project_dir)
+        return self._fill(node, i, (name, summary))
+
+    def missing_files(self):
+        """Fill the slots of files that never produced a summary; returns the nodes that completes"""
+        ready = []
+        for file_path in list(self.file_slots):
+            ready.extend(self.add_file(file_path, None))
+        return ready
+
+    def complete(self, node, summary):
+        """Deliver a reduced node upward; returns the parent if that completes it"""
+        if node.parent is None:
+            return []
+        return self._fill(node.parent, node.slot, (node.label, summary))
+
+    def _fill(self, node, i, named_summary):
+        with self.lock:
+            node.inputs[i] = named_summary
+            node.waiting -= 1
+            return [node] if node.waiting == 0 else []
+
+
+class ProjectReducer:
+    """Summarizes packages on a thread pool as soon as their files finish and merges
+    them upward with bounded fan-in, so the final project call stays small"""
+
+    def __init__(self, project_dir, file_paths, fan_in, max_workers, journal, manifest):
+        self.project_dir = project_dir
+        self.tree = PackageTree(project_dir, file_paths, fan_in)
+        self.journal = journal
+        self.manifest = manifest
+        self.executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="reducer")
+        self.project_summary = Future()
+        self._schedule(self.tree.initially_ready())
+
+    def add_file(self, file_path, summary):
+        self._schedule(self.tree.add_file(file_path, summary))
+
+    def finish(self):
+        """Reduce whatever is left, treating files that never finished as absent,
+        and return the project summary"""
+        self._schedule(self.tree.missing_files())
+        try:
+            return self.project_summary.result()
+        finally:
+            self.executor.shutdown()
+
+    def close(self):
+        self.executor.shutdown(cancel_futures=True)
+
+    def _schedule(self, nodes):
+        for node in nodes:
+            self.executor.submit(self._reduce, node)
+
+    def _reduce(self, node):
+        try:
+            summary = reduce_node(self, node)
+        except Exception as e:
+            if node is self.tree.root:
+                self.project_summary.set_exception(e)
+                return
+            print(f"Skipping package summary for {node.label}: {e!r}")
+            summary = None
+
+        if node is self.tree.root:
+            self.project_summary.set_result(summary)
+        else:
+            self._schedule(self.tree.complete(node, summary))
+
+
+class AsyncProjectReducer:
+    """Event-loop version of ProjectReducer"""
+
+    def __init__(self, project_dir, file_paths, fan_in, journal, manifest):
+        self.project_dir = project_dir
+        self.tree = PackageTree(project_dir, file_paths, fan_in)
+        self.journal = journal
+        self.manifest = manifest
+        self.project_summary = asyncio.get_running_loop().create_future()
+        self.tasks = set()
+        self._schedule(self.tree.initially_ready())
+
+    def add_file(self, file_path, summary):
+        self._schedule(self.tree.add_file(file_path, summary))
+
+    async def finish(self):
+        self._schedule(self.tree.missing_files())
+        return await self.project_summary
+
+    async def close(self):
+        for task in self.tasks:
+            task.cancel()
+        await asyncio.gather(*self.tasks, return_exceptions=True)
+
+    def _schedule(self, nodes):
+        for node in nodes:
+            task = asyncio.ensure_future(self._reduce(node))
+            # the loop keeps only weak references to tasks
+            self.tasks.add(task)
+            task.add_done_callback(self.tasks.discard)
+
+    async def _reduce(self, node):
+        try:
+            summary = await reduce_node_async(self, node)
+        except Exception as e:
+            if node is self.tree.root:
+                self.project_summary.set_exception(e)
+                return
+            print(f"Skipping package summary for {node.label}: {e!r}")
+            summary = None
+
+        if node is self.tree.root:
+            self.project_summary.set_result(summary)
+        else:
+            self._schedule(self.tree.complete(node, summary))
+
+
+def node_inputs(node):
+    """The node's (name, summary) inputs, leaving out empty and failed ones"""
+    return [
+        (name, summary) for name, summary in filter(None, node.inputs)
+        if summary and not summary.startswith("Error:")
+    ]
+
+
+def known_node_summary(reducer, node, named_summaries):
+    """Returns (journal key, summary) where the summary is None when it has to be generated.
+    A package with a single input passes it through without a call"""
+    kind = "project" if node is reducer.tree.root else "package"
+    key = content_hash(kind, node.label, *[f"{name}\0{summary}" for name, summary in named_summaries])
+    if node is not reducer.tree.root:
+        if not named_summaries:
+            return key, ""
+        if len(named_summaries) == 1:
+            return key, named_summaries[0][1]
+
+    summary = reducer.journal.get("package", key)
+    if summary is not None:
+        # a resumed run's manifest must still list it, or the next incremental run redoes it
+        reducer.manifest.record_reduction(key, summary)
+    else:
+        summary = reducer.manifest.reusable_reduction(key)
+        if summary is not None:
+            reducer.journal.record("package", key, summary)
+    return key, summary
+
+
+def record_node_summary(reducer, node, key, summary):
+    reducer.journal.record("package", key, summary, node.label)
+    reducer.manifest.record_reduction(key, summary)
+
+
+def reduce_node(reducer, node):
+    named_summaries = node_inputs(node)
+    key, summary = known_node_summary(reducer, node, named_summaries)
+    if summary is None:
+        if node is reducer.tree.root:
+            summary = summarize_project(
+                [f"{name}\n{text}" for name, text in named_summaries],
+                reducer.project_dir,
+                "Package"
+            )
+        else:
+            summary = summarize_package(named_summaries, node.label)
+            print(f"Completed package summary for {node.label}")
+        record_node_summary(reducer, node, key, summary)
+    return summary
+
+
+async def reduce_node_async(reducer, node):
+    named_summaries = node_inputs(node)
+    key, summary = known_node_summary(reducer, node, named_summaries)
+    if summary is None:
+        if node is reducer.tree.root:
+            summary = await summarize_project_async(
+                [f"{name}\n{text}" for name, text in named_summaries],
+                reducer.project_dir,
+                "Package"
+            )
+        else:
+            summary = await summarize_package_async(named_summaries, node.label)
+            print(f"Completed package summary for {node.label}")
+        record_node_summary(reducer, node, key, summary)
+    return summary
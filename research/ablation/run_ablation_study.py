@@ -7,6 +7,7 @@ import glob
 sys.path.append("../../")
 from openai_client import judge_file_summary_openai
 from llm_client import summarize_file_single_llm
+from summary_store import open_summary_store
 
 
 def find_project_files(project_name):
@@ -25,7 +26,10 @@ def find_project_files(project_name):
     
     # find eval and summary files
     eval_files = glob.glob(os.path.join(project_dir, '*eval*.json'))
-    summary_files = glob.glob(os.path.join(project_dir, f'summary_{project_name}.json'))
+    # prefer the summary store, then the results stream, then the legacy json
+    summary_files = []
+    for suffix in ('.sqlite', '.jsonl', '.jsonl.gz', '.json'):
+        summary_files.extend(glob.glob(os.path.join(project_dir, f'summary_{project_name}{suffix}')))
     
     if not eval_files:
         print(f"no eval files found in {project_dir}")
@@ -54,10 +58,7 @@ def load_top_n_samples(eval_file, n):
 
 
 def load_codestellation_summaries(summary_file):
-    with open(summary_file, 'r') as f:
-        data = json.load(f)
-    
-    return data.get('file_summaries', {})
+    return open_summary_store(summary_file)
 
 
 def read_file_content(file_path):
@@ -125,12 +126,11 @@ def run_ablation_study(project_name, n_samples, output_file):
             continue
         
         # check if codestellation summary exists
-        if file_path not in codestellation_summaries:
+        codestellation_summary = codestellation_summaries.get(file_path)
+        if codestellation_summary is None:
             print(f"  warning: no codestellation summary for {file_path}")
             continue
         
-        codestellation_summary = codestellation_summaries[file_path]
-        
         # generate baseline summary
         print("  generating baseline summary...")
         baseline_summary = summarize_file_single_llm(file_content, file_path)
@@ -157,6 +157,8 @@ def run_ablation_study(project_name, n_samples, output_file):
         })
         codestellation_scores.append(codestellation_judgment['scores'])
     
+    codestellation_summaries.close()
+    
     # compute statistics
     baseline_stats = compute_statistics(baseline_scores)
     codestellation_stats = compute_statistics(codestellation_scores)
@@ -1,27 +1,26 @@
 import sys
 import json
-import random
 import os
 import statistics
 from llm_judge import judge_file_summary, extract_scores
 
 sys.path.append("../../")
 from config import CLAUDE_CONFIG
+from summary_store import open_summary_store
 
 
 def load_project_data(json_path):
-    with open(json_path, 'r') as f:
-        return json.load(f)
+    return open_summary_store(json_path)
 
 
-def sample_files(file_summaries, sample_size):
-    file_paths = list(file_summaries.keys())
+def sample_files(store, sample_size):
+    total_files = store.count()
     
-    if sample_size > len(file_paths):
-        sample_size = len(file_paths)
+    if sample_size > total_files:
+        sample_size = total_files
         print(f"sample size reduced to {sample_size} (total available files)")
     
-    return random.sample(file_paths, sample_size)
+    return [file_path for file_path, _ in store.sample(sample_size)]
 
 
 def read_file_content(file_path):
@@ -35,7 +34,7 @@ def read_file_content(file_path):
         return None
 
 
-def evaluate_summaries(sampled_paths, file_summaries):
+def evaluate_summaries(sampled_paths, store):
     results = []
     all_scores = []
     
@@ -46,7 +45,7 @@ def evaluate_summaries(sampled_paths, file_summaries):
         if file_content is None:
             continue
             
-        summary = file_summaries[file_path]
+        summary = store.get(file_path)
         judgment = judge_file_summary(file_content, summary, CLAUDE_CONFIG["secondary_api_key"])
         
         scores = judgment['scores']
@@ -119,11 +118,11 @@ def main():
     output_path = sys.argv[3]
     
     # load, process, and sample data
-    project_data = load_project_data(json_path)
-    file_summaries = project_data['file_summaries']
+    store = load_project_data(json_path)
     
-    sampled_paths = sample_files(file_summaries, sample_size)
-    results, all_scores = evaluate_summaries(sampled_paths, file_summaries)
+    sampled_paths = sample_files(store, sample_size)
+    results, all_scores = evaluate_summaries(sampled_paths, store)
+    store.close()
     
     statistics_data = compute_statistics(all_scores)
     
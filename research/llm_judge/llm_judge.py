@@ -1,10 +1,10 @@
 import json
-import random
 import re
 import os
 import sys
 sys.path.append('../..')
 from llm_client import call_claude_with_backoff
+from summary_store import open_summary_store
 
 
 def judge_file_summary(file_content, summary, language="Java", api_key=""):
@@ -23,9 +23,9 @@ For each criterion, provide a score on a scale from 1 to 5: 1 (Very poor), 2 (Po
     messages = [{"role": "user", "content": prompt}]
 
     if api_key:
-        response = call_claude_with_backoff(messages, api_key)
+        response = call_claude_with_backoff(messages, api_key=api_key, category="judge")
     else:
-        response = call_claude_with_backoff(messages)
+        response = call_claude_with_backoff(messages, category="judge")
     
     scores = extract_scores(response)
     
@@ -116,17 +116,17 @@ def clean_javadoc(comment_lines):
 
 
 def sample_and_judge(codestellation_file, sample_size, output_file):
-    with open(codestellation_file, 'r') as f:
-        data = json.load(f)
+    store = open_summary_store(codestellation_file)
+    total_files = store.count()
     
-    file_summaries = data['file_summaries']
-    file_paths = list(file_summaries.keys())
-    
-    if sample_size > len(file_paths):
-        sample_size = len(file_paths)
+    if sample_size > total_files:
+        sample_size = total_files
         print(f"sample size reduced to {sample_size} (total available files)")
     
-    sampled_paths = random.sample(file_paths, sample_size)
+    sampled = store.sample(sample_size)
+    store.close()
+    sampled_paths = [file_path for file_path, _ in sampled]
+    file_summaries = dict(sampled)
     
     results = []
     human_scores = []
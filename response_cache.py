@@ -0,0 +1,111 @@
+import os
+import json
+import time
+import sqlite3
+import hashlib
+import threading
+
+from config import LLM_CACHE_CONFIG
+from stats_collector import stats
+
+
+class ResponseCache:
+    """On-disk store of successful LLM responses keyed by a hash of the request payload"""
+
+    def __init__(self, path, max_bytes, enabled=True):
+        self.path = path
+        self.max_bytes = max_bytes
+        self.enabled = enabled
+        self.lock = threading.Lock()
+        self.conn = None
+        self.total_bytes = 0
+
+        if enabled:
+            self._open()
+
+    def _open(self):
+        directory = os.path.dirname(self.path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+
+        self.conn = sqlite3.connect(self.path, check_same_thread=False)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute(
+            "CREATE TABLE IF NOT EXISTS responses ("
+            "key TEXT PRIMARY KEY, response TEXT NOT NULL, size INTEGER NOT NULL, last_used REAL NOT NULL)"
+        )
+        self.conn.execute("CREATE INDEX IF NOT EXISTS responses_last_used ON responses (last_used)")
+        self.conn.commit()
+        self.total_bytes = self.conn.execute("SELECT COALESCE(SUM(size), 0) FROM responses").fetchone()[0]
+
+    def make_key(self, payload):
+        # the payload carries model, temperature, max_tokens and the full messages
+        canonical = json.dumps(payload, sort_keys=True, ensure_ascii=False)
+        return hashlib.sha256(canonical.encode('utf-8')).hexdigest()
+
+    def get(self, key):
+        if not self.enabled:
+            return None
+
+        with self.lock:
+            row = self.conn.execute("SELECT response, size FROM responses WHERE key = ?", (key,)).fetchone()
+            if row is None:
+                stats.log_response_cache_miss()
+                return None
+
+            self.conn.execute("UPDATE responses SET last_used = ? WHERE key = ?", (time.time(), key))
+            self.conn.commit()
+
+        stats.log_response_cache_hit(row[1])
+        return row[0]
+
+    def put(self, key, response):
+        """Store a successful response; callers must never pass error strings"""
+        if not self.enabled:
+            return
+
+        size = len(response.encode('utf-8'))
+        if size > self.max_bytes:
+            return
+
+        with self.lock:
+            existing = self.conn.execute("SELECT size FROM responses WHERE key = ?", (key,)).fetchone()
+            if existing:
+                self.total_bytes -= existing[0]
+
+            self.conn.execute(
+                "INSERT OR REPLACE INTO responses (key, response, size, last_used) VALUES (?, ?, ?, ?)",
+                (key, response, size, time.time())
+            )
+            self.total_bytes += size
+            self._evict()
+            self.conn.commit()
+
+    def _evict(self):
+        # drop least recently used rows until we are back under the byte budget
+        while self.total_bytes > self.max_bytes:
+            rows = self.conn.execute(
+                "SELECT key, size FROM responses ORDER BY last_used LIMIT 100"
+            ).fetchall()
+            if not rows:
+                self.total_bytes = 0
+                break
+
+            for key, size in rows:
+                if self.total_bytes <= self.max_bytes:
+                    break
+                self.conn.execute("DELETE FROM responses WHERE key = ?", (key,))
+                self.total_bytes -= size
+                stats.log_response_cache_eviction()
+
+    def close(self):
+        if self.conn is not None:
+            self.conn.close()
+            self.conn = None
+
+
+response_cache = ResponseCache(
+    LLM_CACHE_CONFIG["path"],
+    LLM_CACHE_CONFIG["max_bytes"],
+    LLM_CACHE_CONFIG["enabled"]
+)
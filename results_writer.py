@@ -0,0 +1,120 @@
+import os
+import gzip
+import json
+import threading
+
+
+def open_results(path, mode):
+    if path.endswith('.gz'):
+        return gzip.open(path, mode + 't', encoding='utf-8')
+    return open(path, mode, encoding='utf-8')
+
+
+def iter_results(path):
+    """Yields each record of a results stream; a record cut short by a crash ends it"""
+    with open_results(path, 'r') as f:
+        try:
+            for line in f:
+                try:
+                    yield json.loads(line)
+                except json.JSONDecodeError:
+                    return
+        except EOFError:
+            # a gzip stream whose writer died has no end marker
+            return
+
+
+def iter_file_summaries(path):
+    for record in iter_results(path):
+        if record['type'] == 'file':
+            yield record['path'], record['summary']
+
+
+class ResultsWriter:
+    """Streams each file summary to a JSONL file, gzip-compressed when the path ends
+    in .gz, as soon as it is generated, and appends the project summary last. Nothing
+    accumulates in memory and every finished summary is on disk if the run dies.
+    Summaries are mirrored into store, a SummaryStore, when one is given"""
+
+    def __init__(self, path, store=None):
+        self.path = path
+        self.store = store
+        self.lock = threading.Lock()
+        self.file_count = 0
+
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self.file = open_results(path, 'w')
+
+    def add_file(self, file_path, summary, content_hash=None):
+        line = json.dumps(
+            {"type": "file", "path": file_path, "summary": summary, "content_hash": content_hash},
+            ensure_ascii=False
+        )
+        with self.lock:
+            self.file.write(line + '\n')
+            self.file.flush()
+            self.file_count += 1
+        if self.store is not None:
+            self.store.add_file(file_path, summary, content_hash)
+
+    def file_summaries(self):
+        """Reads the file summaries written so far back from disk"""
+        with self.lock:
+            self.file.flush()
+        return dict(iter_file_summaries(self.path))
+
+    def finish(self, project_summary, total_files, total_chunks, project_path):
+        record = {
+            "type": "project",
+            "project_summary": project_summary,
+            "total_files": total_files,
+            "total_chunks": total_chunks,
+            "project_path": project_path,
+            "summarized_files": self.file_count
+        }
+        with self.lock:
+            self.file.write(json.dumps(record, ensure_ascii=False) + '\n')
+        if self.store is not None:
+            self.store.set_project(record)
+        self.close()
+        return record
+
+    def close(self):
+        with self.lock:
+            if not self.file.closed:
+                self.file.close()
+        if self.store is not None:
+            self.store.close()
+
+
+def export_summary_json(stream_path, output_path):
+    """Writes the summary_<project>.json layout that json.dump(results, indent=2) used to
+    produce, copying file summaries across one at a time instead of loading them all"""
+    project = {"project_summary": None, "total_files": 0, "total_chunks": 0, "project_path": None}
+    for record in iter_results(stream_path):
+        if record['type'] == 'project':
+            project = record
+
+    def dumps(value):
+        return json.dumps(value, ensure_ascii=False)
+
+    with open(output_path, 'w', encoding='utf-8') as f:
+        f.write('{\n')
+        f.write(f'  "project_summary": {dumps(project["project_summary"])},\n')
+        f.write('  "file_summaries": {')
+
+        first = True
+        for file_path, summary in iter_file_summaries(stream_path):
+            f.write('\n' if first else ',\n')
+            f.write(f'    {dumps(file_path)}: {dumps(summary)}')
+            first = False
+        f.write('}' if first else '\n  }')
+
+        f.write(f',\n  "total_files": {dumps(project["total_files"])},\n')
+        f.write(f'  "total_chunks": {dumps(project["total_chunks"])},\n')
+        f.write(f'  "project_path": {dumps(project["project_path"])}\n')
+        f.write('}')
+
+    return output_path
@@ -0,0 +1,277 @@
+import time
+import queue
+import threading
+from collections import defaultdict, deque
+from concurrent.futures import Future
+from functools import partial
+
+import psutil
+
+from stats_collector import stats
+from summarizer import dependency_key
+
+
+class WorkStealingPool:
+    """Worker threads that each own a deque of tasks; a worker whose deque is empty
+    steals from the back of the longest one instead of sitting idle"""
+
+    def __init__(self, num_workers):
+        self.deques = [deque() for _ in range(num_workers)]
+        self.lock = threading.Lock()
+        self.work_available = threading.Condition(self.lock)
+        self.owners = {}
+        self.planned_load = [0] * num_workers
+        self.shutting_down = False
+        self.cancelled = False
+        self.tasks_run = [0] * num_workers
+        self.steals = [0] * num_workers
+        self.busy_seconds = [0.0] * num_workers
+        self.started = time.monotonic()
+        self.threads = [
+            threading.Thread(target=self._work, args=(i,), name=f"worker-{i}", daemon=True)
+            for i in range(num_workers)
+        ]
+        for thread in self.threads:
+            thread.start()
+
+    def assign(self, owner, size):
+        """Give one owner a home worker as it arrives, onto the least loaded worker"""
+        with self.lock:
+            worker = self.planned_load.index(min(self.planned_load))
+            self.owners[owner] = worker
+            self.planned_load[worker] += size
+
+    def submit(self, fn, *args, owner=None):
+        """Queue fn on its owner's home worker, or the shortest deque if it has none"""
+        future = Future()
+        if self.cancelled:
+            future.cancel()
+            return future
+
+        with self.lock:
+            worker = self.owners.get(owner)
+            if worker is None:
+                worker = min(range(len(self.deques)), key=lambda i: len(self.deques[i]))
+            self.deques[worker].append((future, fn, args))
+            self.work_available.notify()
+        return future
+
+    def cancel_pending(self):
+        """Cancel every queued task and any submitted later; running tasks still finish"""
+        with self.lock:
+            self.cancelled = True
+            tasks = [task for worker_deque in self.deques for task in worker_deque]
+            for worker_deque in self.deques:
+                worker_deque.clear()
+
+        for future, _, _ in tasks:
+            future.cancel()
+        return len(tasks)
+
+    def _next_task(self, worker):
+        if self.deques[worker]:
+            return self.deques[worker].popleft()
+
+        victim = max(self.deques, key=len)
+        if victim:
+            self.steals[worker] += 1
+            return victim.pop()
+        return None
+
+    def _work(self, worker):
+        while True:
+            with self.lock:
+                task = self._next_task(worker)
+                while task is None and not self.shutting_down:
+                    self.work_available.wait()
+                    task = self._next_task(worker)
+            if task is None:
+                return
+
+            future, fn, args = task
+            if not future.set_running_or_notify_cancel():
+                continue
+
+            started = time.monotonic()
+            try:
+                result = fn(*args)
+            except BaseException as e:
+                future.set_exception(e)
+            else:
+                future.set_result(result)
+            self.busy_seconds[worker] += time.monotonic() - started
+            self.tasks_run[worker] += 1
+
+    def shutdown(self):
+        """Finish every queued task, stop the workers and return their utilization"""
+        with self.lock:
+            self.shutting_down = True
+            self.work_available.notify_all()
+        for thread in self.threads:
+            thread.join()
+        return self.utilization()
+
+    def utilization(self):
+        elapsed = max(time.monotonic() - self.started, 1e-9)
+        return [
+            {
+                "worker": i,
+                "tasks": self.tasks_run[i],
+                "steals": self.steals[i],
+                "busy_seconds": self.busy_seconds[i],
+                "utilization": self.busy_seconds[i] / elapsed
+            }
+            for i in range(len(self.threads))
+        ]
+
+
+class ChunkFeeder:
+    """Streams chunks onto the pool as they are produced, blocking the producer
+    while max_pending chunks are already queued or running. Once stop_requested
+    is set it takes no more chunks and cancels the queued ones"""
+
+    def __init__(self, pool, agent, max_pending, stop_requested):
+        self.pool = pool
+        self.agent = agent
+        self.stop_requested = stop_requested
+        self.stopped = False
+        self.slots = threading.BoundedSemaphore(max_pending)
+        self.completed = queue.Queue()
+        self.submitted = 0
+        self.completed_count = 0
+        self.count_lock = threading.Lock()
+
+    def add(self, file_chunks):
+        for chunk in file_chunks:
+            # poll so a stop request is noticed while the queue is full
+            while not self.slots.acquire(timeout=0.5):
+                if self.stop_requested.is_set():
+                    return
+            if self.stop_requested.is_set():
+                self.slots.release()
+                return
+
+            with self.count_lock:
+                self.submitted += 1
+            self._schedule(chunk)
+
+    def progress(self):
+        """(chunks queued or running, chunks done)"""
+        with self.count_lock:
+            return self.submitted - self.completed_count, self.completed_count
+
+    def wait(self):
+        """Block until every added chunk is done or cancelled, re-raising the first failure"""
+        remaining = self.submitted
+        while remaining:
+            if self.stop_requested.is_set() and not self.stopped:
+                self.stopped = True
+                cancelled = self.pool.cancel_pending()
+                print(f"Stopping: cancelled {cancelled} queued tasks, waiting for requests in flight")
+
+            try:
+                future = self.completed.get(timeout=0.5)
+            except queue.Empty:
+                continue
+
+            remaining -= 1
+            if not future.cancelled():
+                future.result()
+
+    def _schedule(self, chunk):
+        self._submit(self.agent.process_chunk, chunk)
+
+    def _submit(self, fn, chunk, *args):
+        future = self.pool.submit(fn, chunk, *args, owner=chunk['file_path'])
+        future.add_done_callback(self._chunk_done)
+
+    def _chunk_done(self, future):
+        self.slots.release()
+        self.completed.put(future)
+
+        with self.count_lock:
+            self.completed_count += 1
+            completed_chunks, submitted = self.completed_count, self.submitted
+        if completed_chunks % 10 == 0:
+            memory_usage = psutil.Process().memory_info().rss / 1024 / 1024
+            print(f"Processed {completed_chunks}/{submitted} chunks - Memory: {memory_usage:.1f}MB")
+
+
+class DependencyScheduler(ChunkFeeder):
+    """Summarizes each referenced method as soon as the first chunk calling it arrives
+    and holds that chunk back until all of its dependency summaries are resolved.
+    Summaries live in the agent's SharedCache; the scheduler only hands each held
+    chunk the ones it waited for"""
+
+    def __init__(self, pool, agent, max_pending, stop_requested, dependency_detector, max_dependency_context):
+        super().__init__(pool, agent, max_pending, stop_requested)
+        self.dependency_detector = dependency_detector
+        self.max_dependency_context = max_dependency_context
+        self.lock = threading.Lock()
+        # key -> chunks held back until that in-flight method summary resolves
+        self.waiters = defaultdict(list)
+
+    def _schedule(self, chunk):
+        # nothing to wait for when the journal or manifest already has this chunk's summary
+        chunk_summary, is_file_summary = self.agent.known_chunk_summary(chunk)
+        if chunk_summary is not None:
+            self._submit(self.agent.record_chunk_summary, chunk, chunk_summary, is_file_summary)
+            return
+
+        dependencies = self.dependency_detector.find_dependencies(chunk)[:self.max_dependency_context]
+        held = {"chunk": chunk, "dependencies": dependencies, "summaries": {}, "waiting": 0}
+        seen = set()
+        new_methods = []
+
+        with self.lock:
+            for dep in dependencies:
+                key = dependency_key(dep)
+                if key in seen:
+                    continue
+                seen.add(key)
+
+                # a summary in flight or in the cache costs this chunk no call
+                if key in self.waiters:
+                    stats.log_cache_hit()
+                else:
+                    summary = self.agent.shared_cache.get(key)
+                    if summary is not None:
+                        stats.log_cache_hit()
+                        held["summaries"][key] = summary
+                        continue
+                    new_methods.append((key, dep))
+                self.waiters[key].append(held)
+                held["waiting"] += 1
+            ready = held["waiting"] == 0
+
+        for key, dep in new_methods:
+            future = self.pool.submit(self.agent.summarize_dependency, dep)
+            future.add_done_callback(partial(self._method_done, key))
+
+        if ready:
+            self._release(held)
+
+    def _method_done(self, key, future):
+        summary = None
+        if future.cancelled():
+            pass
+        elif future.exception() is not None:
+            print(f"Skipping dependency context for {key}: {future.exception()!r}")
+        else:
+            summary = future.result()
+
+        ready = []
+        with self.lock:
+            for held in self.waiters.pop(key):
+                # a failed summary still counts as resolved; the chunk goes without it
+                if summary is not None:
+                    held["summaries"][key] = summary
+                held["waiting"] -= 1
+                if held["waiting"] == 0:
+                    ready.append(held)
+
+        for held in ready:
+            self._release(held)
+
+    def _release(self, held):
+        self._submit(self.agent.process_chunk, held["chunk"], held["dependencies"], held["summaries"])
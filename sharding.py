@@ -0,0 +1,206 @@
+import os
+import json
+import time
+import heapq
+import sqlite3
+
+
+def file_dependency_graph(file_paths, dependency_detector):
+    """Undirected call graph between files: path -> set of paths it calls or is called by"""
+    neighbours = {file_path: set() for file_path in file_paths}
+    for file_path in file_paths:
+        for target in dependency_detector.file_calls(file_path):
+            if target in neighbours:
+                neighbours[file_path].add(target)
+                neighbours[target].add(file_path)
+    return neighbours
+
+
+def partition_files(file_paths, dependency_detector, shard_count):
+    """Splits files into at most shard_count shards of similar total size. Each shard
+    grows from a seed by taking the file with the most calls into it, so dependencies
+    mostly stay within a shard; when a shard's component runs out it continues with
+    the next file in path order, which keeps packages together"""
+    neighbours = file_dependency_graph(file_paths, dependency_detector)
+    sizes = {}
+    for file_path in file_paths:
+        try:
+            sizes[file_path] = max(os.path.getsize(file_path), 1)
+        except OSError:
+            sizes[file_path] = 1
+
+    capacity = sum(sizes.values()) / max(shard_count, 1)
+    order = sorted(file_paths)
+    assigned = {}
+    next_seed = 0
+    shards = []
+
+    while len(assigned) < len(file_paths):
+        shard_id = len(shards)
+        last_shard = shard_id == shard_count - 1
+        shard = []
+        shard_size = 0
+        links = {}
+        frontier = []
+
+        while len(assigned) < len(file_paths) and (last_shard or shard_size < capacity):
+            file_path = None
+            while frontier:
+                _, candidate = heapq.heappop(frontier)
+                if candidate not in assigned:
+                    file_path = candidate
+                    break
+            if file_path is None:
+                while order[next_seed] in assigned:
+                    next_seed += 1
+                file_path = order[next_seed]
+
+            assigned[file_path] = shard_id
+            shard.append(file_path)
+            shard_size += sizes[file_path]
+            for neighbour in neighbours[file_path]:
+                if neighbour not in assigned:
+                    links[neighbour] = links.get(neighbour, 0) + 1
+                    # stale entries with fewer links are skipped once the file is assigned
+                    heapq.heappush(frontier, (-links[neighbour], neighbour))
+
+        shards.append(shard)
+
+    edges = sum(len(linked) for linked in neighbours.values()) // 2
+    crossing = sum(
+        1 for file_path, linked in neighbours.items() for neighbour in linked
+        if file_path < neighbour and assigned[file_path] != assigned[neighbour]
+    )
+    print(f"Partitioned {len(file_paths)} files into {len(shards)} shards; "
+          f"{crossing} of {edges} file dependencies cross shards")
+    return shards
+
+
+class ShardQueue:
+    """Shards of a project and their results in SQLite, shared by a coordinator and
+    any number of worker processes on hosts that can reach the file. A worker claims
+    a shard and keeps a heartbeat on it; a shard whose heartbeat is older than lease
+    seconds goes to the next worker that asks, as does one a worker gave back"""
+
+    def __init__(self, path, lease, max_attempts=3, reset=False):
+        self.path = path
+        self.lease = lease
+        self.max_attempts = max_attempts
+
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        if reset and os.path.exists(path):
+            os.remove(path)
+
+        # autocommit, so claims can take the write lock with BEGIN IMMEDIATE
+        self.conn = sqlite3.connect(path, timeout=60, isolation_level=None)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute(
+            "CREATE TABLE IF NOT EXISTS shards ("
+            "id INTEGER PRIMARY KEY, files TEXT NOT NULL, state TEXT NOT NULL DEFAULT 'pending', "
+            "worker TEXT, heartbeat REAL, attempts INTEGER NOT NULL DEFAULT 0, "
+            "total_chunks INTEGER, manifest TEXT)"
+        )
+        self.conn.execute(
+            "CREATE TABLE IF NOT EXISTS results ("
+            "path TEXT PRIMARY KEY, shard INTEGER NOT NULL, content_hash TEXT, summary TEXT NOT NULL)"
+        )
+
+    def fill(self, shards):
+        """Queues lists of files as shards; returns how many"""
+        with self.conn:
+            self.conn.execute("BEGIN IMMEDIATE")
+            self.conn.executemany(
+                "INSERT INTO shards (id, files) VALUES (?, ?)",
+                [(shard_id, json.dumps(files)) for shard_id, files in enumerate(shards)]
+            )
+        return len(shards)
+
+    def claim(self, worker):
+        """Returns (shard id, files) for the next shard this worker should run, or None.
+        Taking over a shard whose lease expired counts as a failed attempt, so a shard
+        that keeps killing its workers stops being handed out after max_attempts"""
+        with self.conn:
+            self.conn.execute("BEGIN IMMEDIATE")
+            row = self.conn.execute(
+                "SELECT id, files, state FROM shards WHERE "
+                "(state = 'pending' AND attempts < ?) OR (state = 'claimed' AND heartbeat < ? AND attempts + 1 < ?) "
+                "ORDER BY id LIMIT 1",
+                (self.max_attempts, time.time() - self.lease, self.max_attempts)
+            ).fetchone()
+            if row is None:
+                return None
+            self.conn.execute(
+                "UPDATE shards SET state = 'claimed', worker = ?, heartbeat = ?, attempts = attempts + ? WHERE id = ?",
+                (worker, time.time(), 1 if row[2] == 'claimed' else 0, row[0])
+            )
+        return row[0], json.loads(row[1])
+
+    def heartbeat(self, shard_id, worker):
+        self.conn.execute(
+            "UPDATE shards SET heartbeat = ? WHERE id = ? AND worker = ? AND state = 'claimed'",
+            (time.time(), shard_id, worker)
+        )
+
+    def release(self, shard_id, worker, failed):
+        """Hands a shard back; failed ones count toward max_attempts"""
+        self.conn.execute(
+            "UPDATE shards SET state = 'pending', worker = NULL, attempts = attempts + ? "
+            "WHERE id = ? AND worker = ? AND state = 'claimed'",
+            (1 if failed else 0, shard_id, worker)
+        )
+
+    def complete(self, shard_id, file_summaries, total_chunks, manifest):
+        """Stores a shard's (path, summary, content hash) results and marks it done in one
+        transaction; a shard that ran twice after a lost lease keeps the last results"""
+        with self.conn:
+            self.conn.execute("BEGIN IMMEDIATE")
+            self.conn.execute("DELETE FROM results WHERE shard = ?", (shard_id,))
+            self.conn.executemany(
+                "INSERT OR REPLACE INTO results (path, shard, content_hash, summary) VALUES (?, ?, ?, ?)",
+                [(file_path, shard_id, content_hash, summary) for file_path, summary, content_hash in file_summaries]
+            )
+            self.conn.execute(
+                "UPDATE shards SET state = 'done', total_chunks = ?, manifest = ? WHERE id = ?",
+                (total_chunks, json.dumps(manifest, ensure_ascii=False), shard_id)
+            )
+
+    def progress(self):
+        """Returns (done, claimed by a live worker, still claimable) shard counts"""
+        done, live, claimable = self.conn.execute(
+            "SELECT "
+            "SUM(state = 'done'), "
+            "SUM(state = 'claimed' AND heartbeat >= ?), "
+            "SUM((state = 'pending' AND attempts < ?) OR (state = 'claimed' AND heartbeat < ? AND attempts + 1 < ?)) "
+            "FROM shards",
+            (time.time() - self.lease, self.max_attempts, time.time() - self.lease, self.max_attempts)
+        ).fetchone()
+        return done or 0, live or 0, claimable or 0
+
+    def shard_count(self):
+        return self.conn.execute("SELECT COUNT(*) FROM shards").fetchone()[0]
+
+    def total_chunks(self):
+        return self.conn.execute("SELECT COALESCE(SUM(total_chunks), 0) FROM shards").fetchone()[0]
+
+    def manifests(self):
+        for (manifest,) in self.conn.execute("SELECT manifest FROM shards WHERE state = 'done' ORDER BY id"):
+            yield json.loads(manifest)
+
+    def results(self):
+        """Yields (path, summary, content hash) for every finished file"""
+        yield from self.conn.execute("SELECT path, summary, content_hash FROM results ORDER BY path")
+
+    def close(self):
+        self.conn.close()
+
+
+def hold_claim(path, lease, shard_id, worker, released):
+    """Keeps a claimed shard's heartbeat fresh until released is set, on a connection of its own"""
+    queue = ShardQueue(path, lease)
+    try:
+        while not released.wait(lease / 4):
+            queue.heartbeat(shard_id, worker)
+    finally:
+        queue.close()
@@ -8,18 +8,65 @@ class StatsCollector:
     def __init__(self):
         self.lock = threading.Lock()
         self.llm_calls = defaultdict(int)
+        self.token_usage = defaultdict(lambda: defaultdict(int))
+        self.latencies = defaultdict(list)
+        self.token_estimates = defaultdict(lambda: {"requests": 0, "predicted": 0, "actual": 0})
         self.dependency_extractions = 0
         self.cache_hits = 0
         self.cache_misses = 0
+        self.cache_coalesced = 0
+        self.cache_waits = 0
+        self.method_cache_evictions = 0
+        self.method_cache_rejections = 0
+        self.method_cache_entries = 0
+        self.method_cache_bytes = 0
+        self.cache_wait_seconds = 0.0
+        self.cache_wait_timeouts = 0
         self.dependencies_found = 0
         self.dependencies_resolved = 0
+        self.http_connections = {}
+        self.hedged_requests = defaultdict(lambda: {"sent": 0, "won": 0})
+        self.circuit_breakers = defaultdict(lambda: {"state": None, "transitions": [], "retries_denied": 0})
+        self.response_cache_hits = 0
+        self.response_cache_misses = 0
+        self.response_cache_bytes_saved = 0
+        self.response_cache_evictions = 0
+        self.workers = []
+        self.incremental = defaultdict(int)
+        self.coverage = None
+        self.calls_saved = defaultdict(int)
+        self.first_request_time = None
         self.start_time = None
         self.end_time = None
         
+    def reset(self):
+        """Start counting afresh, for a worker process that runs several shards"""
+        self.__init__()
+
     def log_llm_call(self, category):
         with self.lock:
             self.llm_calls[category] += 1
     
+    def log_llm_response(self, category, usage, latency=None):
+        """Record the usage block and wall-clock latency of one response"""
+        category = category or "uncategorized"
+        with self.lock:
+            totals = self.token_usage[category]
+            totals["responses"] += 1
+            for key in ("input_tokens", "output_tokens", "cache_creation_input_tokens", "cache_read_input_tokens"):
+                totals[key] += usage.get(key) or 0
+
+            # batch results have no per-request latency
+            if latency is not None:
+                self.latencies[category].append(latency)
+    
+    def log_token_estimate(self, category, predicted, actual):
+        with self.lock:
+            estimate = self.token_estimates[category or "uncategorized"]
+            estimate["requests"] += 1
+            estimate["predicted"] += predicted
+            estimate["actual"] += actual
+    
     def log_dependency_extracted(self):
         with self.lock:
             self.dependency_extractions += 1
@@ -32,6 +79,31 @@ class StatsCollector:
         with self.lock:
             self.cache_misses += 1
     
+    def log_cache_coalesced(self):
+        """A requester joined a computation already in flight instead of starting its own"""
+        with self.lock:
+            self.cache_coalesced += 1
+    
+    def log_cache_wait(self, seconds, timed_out=False):
+        with self.lock:
+            self.cache_waits += 1
+            self.cache_wait_seconds += seconds
+            if timed_out:
+                self.cache_wait_timeouts += 1
+    
+    def log_method_cache_eviction(self):
+        with self.lock:
+            self.method_cache_evictions += 1
+    
+    def log_method_cache_rejection(self):
+        with self.lock:
+            self.method_cache_rejections += 1
+    
+    def log_method_cache_residency(self, entries, resident_bytes):
+        with self.lock:
+            self.method_cache_entries = entries
+            self.method_cache_bytes = resident_bytes
+    
     def log_dependency_found(self):
         with self.lock:
             self.dependencies_found += 1
@@ -40,6 +112,77 @@ class StatsCollector:
         with self.lock:
             self.dependencies_resolved += 1
     
+    def log_connection_usage(self, host, requests_sent, connections_opened):
+        with self.lock:
+            self.http_connections[host] = {
+                "requests": requests_sent,
+                "connections_opened": connections_opened,
+                "connections_reused": max(requests_sent - connections_opened, 0)
+            }
+    
+    def log_response_cache_hit(self, size):
+        with self.lock:
+            self.response_cache_hits += 1
+            self.response_cache_bytes_saved += size
+    
+    def log_response_cache_miss(self):
+        with self.lock:
+            self.response_cache_misses += 1
+    
+    def log_response_cache_eviction(self):
+        with self.lock:
+            self.response_cache_evictions += 1
+    
+    def log_hedge(self, category, won):
+        with self.lock:
+            hedges = self.hedged_requests[category or "uncategorized"]
+            hedges["sent"] += 1
+            if won:
+                hedges["won"] += 1
+    
+    def log_breaker_state(self, name, state):
+        with self.lock:
+            breaker = self.circuit_breakers[name]
+            if breaker["state"] is not None:
+                breaker["transitions"].append({"from": breaker["state"], "to": state, "time": time.time()})
+            breaker["state"] = state
+    
+    def log_retry_denied(self, name):
+        with self.lock:
+            self.circuit_breakers[name]["retries_denied"] += 1
+    
+    def log_worker_utilization(self, workers):
+        with self.lock:
+            self.workers = list(workers)
+
+    def log_incremental(self, event):
+        with self.lock:
+            self.incremental[event] += 1
+
+    def log_call_saved(self, reason):
+        with self.lock:
+            self.calls_saved[reason] += 1
+
+    def log_coverage(self, coverage):
+        with self.lock:
+            self.coverage = coverage
+
+    def spent(self):
+        """(API requests sent, tokens billed) so far"""
+        with self.lock:
+            tokens = sum(
+                usage["input_tokens"] + usage["output_tokens"]
+                + usage["cache_creation_input_tokens"] + usage["cache_read_input_tokens"]
+                for usage in self.token_usage.values()
+            )
+            return self.llm_calls.get("api_request", 0), tokens
+
+    def log_request_sent(self):
+        if self.first_request_time is None:
+            with self.lock:
+                if self.first_request_time is None:
+                    self.first_request_time = time.time()
+
     def start_timing(self):
         self.start_time = time.time()
     
@@ -52,13 +195,45 @@ class StatsCollector:
         stats = {
             "project": project_name,
             "llm_calls": dict(self.llm_calls),
+            "llm_usage": {category: self._usage_summary(category) for category in self.token_usage},
+            "token_estimates": {
+                category: dict(estimate, actual_to_predicted=estimate["actual"] / estimate["predicted"] if estimate["predicted"] else 0)
+                for category, estimate in self.token_estimates.items()
+            },
             "dependency_extractions": self.dependency_extractions,
             "cache_hits": self.cache_hits,
             "cache_misses": self.cache_misses,
             "cache_hit_rate": self.cache_hits / (self.cache_hits + self.cache_misses) if (self.cache_hits + self.cache_misses) > 0 else 0,
+            "cache_coalesced": self.cache_coalesced,
+            "method_cache": {
+                "evictions": self.method_cache_evictions,
+                "rejected_admissions": self.method_cache_rejections,
+                "resident_entries": self.method_cache_entries,
+                "resident_bytes": self.method_cache_bytes
+            },
+            "cache_waits": {
+                "count": self.cache_waits,
+                "total_seconds": self.cache_wait_seconds,
+                "timeouts": self.cache_wait_timeouts
+            },
             "dependencies_found": self.dependencies_found,
             "dependencies_resolved": self.dependencies_resolved,
             "dependency_resolution_rate": self.dependencies_resolved / self.dependencies_found if self.dependencies_found > 0 else 0,
+            "http_connections": dict(self.http_connections),
+            "hedged_requests": {category: dict(hedges) for category, hedges in self.hedged_requests.items()},
+            "circuit_breakers": {name: dict(breaker) for name, breaker in self.circuit_breakers.items()},
+            "response_cache": {
+                "hits": self.response_cache_hits,
+                "misses": self.response_cache_misses,
+                "hit_rate": self.response_cache_hits / (self.response_cache_hits + self.response_cache_misses) if (self.response_cache_hits + self.response_cache_misses) > 0 else 0,
+                "bytes_saved": self.response_cache_bytes_saved,
+                "evictions": self.response_cache_evictions
+            },
+            "workers": self.workers,
+            "incremental": dict(self.incremental),
+            "coverage": self.coverage,
+            "calls_saved": dict(self.calls_saved),
+            "time_to_first_request_seconds": self.first_request_time - self.start_time if self.start_time and self.first_request_time else None,
             "total_time_seconds": self.end_time - self.start_time if self.start_time and self.end_time else 0
         }
         
@@ -68,4 +243,28 @@ class StatsCollector:
         
         return output_file
 
+    def _usage_summary(self, category):
+        summary = dict(self.token_usage[category])
+        latencies = sorted(self.latencies[category])
+        if not latencies:
+            return summary
+
+        total_latency = sum(latencies)
+        summary["latency_seconds"] = {
+            "total": total_latency,
+            "mean": total_latency / len(latencies),
+            "p50": _percentile(latencies, 0.50),
+            "p90": _percentile(latencies, 0.90),
+            "p95": _percentile(latencies, 0.95),
+            "p99": _percentile(latencies, 0.99),
+            "max": latencies[-1]
+        }
+        summary["output_tokens_per_second"] = summary["output_tokens"] / total_latency if total_latency > 0 else 0
+        return summary
+
+
+def _percentile(sorted_values, q):
+    return sorted_values[min(int(q * len(sorted_values)), len(sorted_values) - 1)]
+
+
 stats = StatsCollector()
@@ -1,131 +1,555 @@
+import time
 import threading
-from collections import defaultdict
+from collections import defaultdict, OrderedDict
+from concurrent.futures import ThreadPoolExecutor, Future
 
 from stats_collector import stats
-from llm_client import summarize_chunk, summarize_method, summarize_file
+from journal import content_hash
+from llm_client import summarize_chunk, summarize_method, summarize_file, summarize_section, summarize_single_chunk_file
+
+
+def dependency_key(dependency):
+    return f"{dependency['file_path']}::{dependency['class_name']}::{dependency['method_name']}"
+
+
+def chunk_journal_key(chunk):
+    return content_hash(chunk['file_path'], chunk['start_line'], chunk['content'])
+
+
+def chunk_journal_kind(is_file_summary):
+    # a single chunk file's summary is journaled apart, so a resume still treats it as the file summary
+    return "single_file" if is_file_summary else "chunk"
+
+
+def journaled_chunk_summary(journal, chunk_key):
+    """(summary, is_file_summary) from the journal, or (None, False)"""
+    for is_file_summary in (True, False):
+        chunk_summary = journal.get(chunk_journal_kind(is_file_summary), chunk_key)
+        if chunk_summary is not None:
+            return chunk_summary, is_file_summary
+    return None, False
+
+
+def single_file_failed(chunk, file_summary):
+    """Whether the combined chunk and file call failed, so the chunk takes the usual
+    chunk summary and file summary calls instead; its error is never the file summary"""
+    if not file_summary.startswith("Error:"):
+        return False
+    print(f"Falling back to separate chunk and file summaries for {chunk['file_path']}: {file_summary}")
+    return True
+
+
+def method_journal_key(dependency, method_content):
+    return content_hash(dependency_key(dependency), method_content)
+
+
+def file_journal_key(file_path, chunk_summaries):
+    return content_hash(file_path, *chunk_summaries)
+
+
+def section_journal_key(file_path, summaries):
+    return content_hash("section", file_path, *summaries)
+
+
+# The journal and manifest bookkeeping below is shared by the thread and event-loop
+# agents, which differ only in how they wait for calls. agent and finalizer are either
+# a SummarizerAgent and its FileFinalizer or one AsyncSummarizerAgent
+
+
+def known_chunk_summary(agent, chunk):
+    """(summary, is_file_summary) for the chunk from the journal or an unchanged chunk
+    in the manifest, else (None, False)"""
+    chunk_key = chunk_journal_key(chunk)
+    chunk_summary, is_file_summary = journaled_chunk_summary(agent.journal, chunk_key)
+    if chunk_summary is not None:
+        # the manifest still needs the dependencies a resumed chunk was written against
+        dependencies = agent.dependency_detector.find_dependencies(chunk)
+        agent.manifest.record_chunk(chunk, chunk_summary, dependencies[:agent.max_dependency_context])
+        return chunk_summary, is_file_summary
+
+    chunk_summary = agent.manifest.reusable_chunk_summary(chunk)
+    if chunk_summary is not None:
+        agent.journal.record("chunk", chunk_key, chunk_summary, chunk['file_path'])
+    return chunk_summary, False
+
+
+def store_chunk_summary(agent, chunk, chunk_summary, dependencies, is_file_summary=False):
+    agent.journal.record(chunk_journal_kind(is_file_summary), chunk_journal_key(chunk), chunk_summary, chunk['file_path'])
+    agent.manifest.record_chunk(chunk, chunk_summary, dependencies[:agent.max_dependency_context])
+
+
+def is_single_chunk_file(agent, chunk):
+    """Whether one call can summarize the chunk's whole file, saving the file summary call"""
+    return agent.single_chunk_fast_path and agent.completion_tracker.expected(chunk['file_path']) == 1
+
+
+def chunk_result(chunk, chunk_summary, is_file_summary):
+    return {
+        'summary': chunk_summary,
+        'chunk_index': chunk['chunk_index'],
+        'start_line': chunk['start_line'],
+        'end_line': chunk['end_line'],
+        'is_file_summary': is_file_summary
+    }
+
+
+def dependency_context(dependencies, method_summaries):
+    """Joins the method summaries of dependencies into a chunk's context; a summary
+    may be an exception, for a call that failed or timed out, and is then skipped"""
+    context_parts = []
+    for dep, method_summary in zip(dependencies, method_summaries):
+        if isinstance(method_summary, Exception):
+            print(f"Skipping dependency context for {dependency_key(dep)}: {method_summary!r}")
+            continue
+        if method_summary:
+            stats.log_dependency_extracted()
+            context_parts.append(method_summary)
+    return '\n'.join(context_parts)
+
+
+def known_method_summary(agent, dependency):
+    """Returns (journal key, method content, summary) where the summary is None when it
+    has to be generated"""
+    method_content = agent.dependency_detector.extract_method_from_file(
+        dependency['file_path'],
+        dependency['method_name']
+    )
+    method_key = method_journal_key(dependency, method_content)
+    return method_key, method_content, agent.journal.get("method", method_key)
+
+
+def record_method_summary(agent, dependency, method_key, method_summary):
+    # failed calls come back as error strings; raise so they are not cached
+    if method_summary.startswith("Error:"):
+        raise RuntimeError(method_summary)
+    agent.journal.record("method", method_key, method_summary, dependency['file_path'])
+    return method_summary
+
+
+def known_section_summary(finalizer, file_path, parts):
+    """Returns (journal key, summary) for one summary over consecutive parts, where
+    the summary is None when it has to be generated"""
+    section_key = section_journal_key(file_path, [part['summary'] for part in parts])
+    summary = finalizer.journal.get("section", section_key)
+    if summary is not None:
+        finalizer.manifest.record_reduction(section_key, summary)
+    else:
+        summary = finalizer.manifest.reusable_reduction(section_key)
+        if summary is not None:
+            finalizer.journal.record("section", section_key, summary, file_path)
+    return section_key, summary
+
+
+def reduced_section(finalizer, file_path, parts, section_key, summary):
+    """The parts as one part with the section's summary, or the parts themselves if its call failed"""
+    if summary.startswith("Error:"):
+        print(f"Keeping chunk summaries for a section of {file_path}: {summary}")
+        return parts
+    finalizer.journal.record("section", section_key, summary, file_path)
+    finalizer.manifest.record_reduction(section_key, summary)
+    return section_part(parts, summary)
+
+
+def section_part(parts, summary):
+    return [{'summary': summary, 'start_line': parts[0]['start_line'], 'end_line': parts[-1]['end_line']}]
+
+
+def ordered_parts(sections):
+    return sorted((part for section in sections for part in section), key=lambda x: x['start_line'])
+
+
+def section_groups(parts, section_size):
+    return [parts[i:i + section_size] for i in range(0, len(parts), section_size)]
+
+
+def known_file_summary(finalizer, file_path, chunks):
+    """Returns (journal key, summary) for the file's chunk results in line order, where
+    the summary is None when it has to be generated. A single chunk file whose chunk
+    summary is its file summary passes it through without a call"""
+    file_key = file_journal_key(file_path, [chunk['summary'] for chunk in chunks])
+    file_summary = finalizer.journal.get("file", file_key)
+    if file_summary is None:
+        file_summary = finalizer.manifest.reusable_file_summary(file_path, file_key)
+        if file_summary is None and len(chunks) == 1 and chunks[0]['is_file_summary']:
+            file_summary = chunks[0]['summary']
+        if file_summary is not None:
+            finalizer.journal.record("file", file_key, file_summary, file_path)
+    if file_summary is not None:
+        finalizer.manifest.record_file(file_path, file_key, file_summary)
+    return file_key, file_summary
+
+
+def record_file_summary(finalizer, file_path, file_key, file_summary):
+    finalizer.journal.record("file", file_key, file_summary, file_path)
+    finalizer.manifest.record_file(file_path, file_key, file_summary)
+
+
+def publish_file_summary(finalizer, file_path, file_summary):
+    finalizer.writer.add_file(file_path, file_summary, finalizer.manifest.content_hash(file_path))
+    print(f"Completed file summary for {file_path}")
+    if finalizer.reducer is not None:
+        finalizer.reducer.add_file(file_path, file_summary)
 
 
 class SummarizerAgent:
-    def __init__(self, dependency_detector, shared_cache, max_dependency_context, shared_file_summaries):
+    def __init__(self, dependency_detector, shared_cache, max_dependency_context, completion_tracker, finalizer, journal, manifest, single_chunk_fast_path=True):
         self.dependency_detector = dependency_detector
         self.shared_cache = shared_cache
         self.max_dependency_context = max_dependency_context
-        self.shared_file_summaries = shared_file_summaries
-        self.file_chunks = defaultdict(list)
+        self.completion_tracker = completion_tracker
+        self.finalizer = finalizer
+        self.journal = journal
+        self.manifest = manifest
+        self.single_chunk_fast_path = single_chunk_fast_path
         self.lock = threading.Lock()
 
-    def process_chunk(self, chunk):
-        dependencies = self.dependency_detector.find_dependencies(chunk)
-        context = self._gather_dependency_context(dependencies)
-        
-        chunk_summary = summarize_chunk(chunk['content'], context)
-        
+    def process_chunk(self, chunk, dependencies=None, method_summaries=None):
+        chunk_summary, is_file_summary = self.known_chunk_summary(chunk)
+
+        if chunk_summary is None:
+            if dependencies is None:
+                dependencies = self.dependency_detector.find_dependencies(chunk)
+            context = self.build_chunk_context(chunk, dependencies, method_summaries)
+            is_file_summary = self.is_single_chunk_file(chunk)
+            if is_file_summary:
+                chunk_summary = summarize_single_chunk_file(chunk['content'], context, chunk['file_path'])
+                is_file_summary = not single_file_failed(chunk, chunk_summary)
+            if not is_file_summary:
+                chunk_summary = summarize_chunk(chunk['content'], context)
+            self.store_chunk_summary(chunk, chunk_summary, dependencies, is_file_summary)
+
+        return self.record_chunk_summary(chunk, chunk_summary, is_file_summary)
+
+    def is_single_chunk_file(self, chunk):
+        return is_single_chunk_file(self, chunk)
+
+    def known_chunk_summary(self, chunk):
+        return known_chunk_summary(self, chunk)
+
+    def store_chunk_summary(self, chunk, chunk_summary, dependencies, is_file_summary=False):
+        store_chunk_summary(self, chunk, chunk_summary, dependencies, is_file_summary)
+
+    def record_chunk_summary(self, chunk, chunk_summary, is_file_summary=False):
+        """Returns the chunk summary and, for the chunk that completes its file,
+        the future of that file's summary. is_file_summary marks the summary of a
+        single chunk file that already serves as the file summary"""
+        # queued under the lock, so a file cannot reach the finalizer before the
+        # section another worker completed just ahead of it
         with self.lock:
-            self.file_chunks[chunk['file_path']].append({
-                'summary': chunk_summary,
-                'start_line': chunk['start_line'],
-                'end_line': chunk['end_line']
-            })
-            
-            if self._is_file_complete(chunk['file_path']):
-                file_summary = self._generate_file_summary(chunk['file_path'])
-                self.shared_file_summaries[chunk['file_path']] = file_summary
-                print(f"Completed file summary for {chunk['file_path']}")
-                return chunk_summary, file_summary
-            else:
+            section, completed_chunks = self.completion_tracker.add_chunk(
+                chunk['file_path'],
+                chunk_result(chunk, chunk_summary, is_file_summary)
+            )
+
+            # sections of long files are summarized as soon as their chunks are in
+            if section is not None:
+                self.finalizer.submit_section(chunk['file_path'], section)
+
+            if completed_chunks is None:
                 return chunk_summary, None
-        
-        return chunk_summary, None
 
-    def _gather_dependency_context(self, dependencies):
-        context_parts = []
-        
-        for dep in dependencies[:self.max_dependency_context]:
-            method_key = f"{dep['file_path']}::{dep['class_name']}::{dep['method_name']}"
-            
-            method_summary = self.shared_cache.get_or_compute(
-                method_key,
-                lambda: self._summarize_dependency_method(dep)
-            )
-            
-            if method_summary:
-                stats.log_dependency_extracted()
-                context_parts.append(method_summary)
-        
-        return '\n'.join(context_parts)
+            # the file summary call runs on the finalizer's queue, not under this lock
+            return chunk_summary, self.finalizer.submit(chunk['file_path'], completed_chunks)
 
-    def _summarize_dependency_method(self, dependency):
-        method_content = self.dependency_detector.extract_method_from_file(
-            dependency['file_path'], 
-            dependency['method_name']
+    def build_chunk_context(self, chunk, dependencies=None, method_summaries=None):
+        """method_summaries, when given, holds every dependency summary already resolved
+        for this chunk; dependencies missing from it failed and are skipped"""
+        if dependencies is None:
+            dependencies = self.dependency_detector.find_dependencies(chunk)
+        return self._gather_dependency_context(dependencies, method_summaries)
+
+    def summarize_dependency(self, dependency):
+        return self.shared_cache.get_or_compute(
+            dependency_key(dependency),
+            lambda: self._summarize_dependency_method(dependency)
         )
-        
-        return summarize_method(
+
+    def _gather_dependency_context(self, dependencies, method_summaries=None):
+        dependencies = dependencies[:self.max_dependency_context]
+        if method_summaries is not None:
+            return dependency_context(dependencies, [method_summaries.get(dependency_key(dep)) for dep in dependencies])
+
+        summaries = []
+        for dep in dependencies:
+            try:
+                summaries.append(self.summarize_dependency(dep))
+            except Exception as e:
+                # covers both our own failed call and a failure or timeout we waited on
+                summaries.append(e)
+        return dependency_context(dependencies, summaries)
+
+    def _summarize_dependency_method(self, dependency):
+        method_key, method_content, journaled = known_method_summary(self, dependency)
+        if journaled is not None:
+            return journaled
+
+        method_summary = summarize_method(
             method_content, 
             dependency['file_path'], 
             dependency['method_name']
         )
+        return record_method_summary(self, dependency, method_key, method_summary)
 
-    def _is_file_complete(self, file_path):
-        return len(self.file_chunks[file_path]) >= self._get_expected_chunks(file_path)
 
-    def _get_expected_chunks(self, file_path):
-        if not hasattr(self, '_expected_chunks'):
-            return 1
-        return self._expected_chunks.get(file_path, 1)
+class CompletionTracker:
+    """Collects chunk summaries per file for every agent and detects when a file is done,
+    and for files of more than section_size chunks when each run of section_size
+    consecutive chunks is done"""
 
-    def set_expected_chunks(self, file_path, count):
-        if not hasattr(self, '_expected_chunks'):
-            self._expected_chunks = {}
-        self._expected_chunks[file_path] = count
+    def __init__(self, expected_chunks, section_size):
+        self.expected_chunks = dict(expected_chunks)
+        self.file_chunks = defaultdict(list)
+        self.section_size = section_size
+        self.section_chunks = defaultdict(list)
+        self.lock = threading.Lock()
 
-    def _generate_file_summary(self, file_path):
-        chunks = sorted(self.file_chunks[file_path], key=lambda x: x['start_line'])
-        chunk_summaries = [chunk['summary'] for chunk in chunks]
-        
-        return summarize_file(chunk_summaries, file_path)
+    def expect(self, file_path, chunk_count):
+        with self.lock:
+            self.expected_chunks[file_path] = chunk_count
+
+    def expected(self, file_path):
+        with self.lock:
+            return self.expected_chunks.get(file_path, 1)
+
+    def add_chunk(self, file_path, chunk_result):
+        """Returns (section, completed): the chunk results of the section this one
+        completes and all of the file's chunk results when this one completes the file,
+        each None otherwise"""
+        with self.lock:
+            expected = self.expected_chunks.get(file_path, 1)
+            section = None
+            if expected > self.section_size:
+                index = chunk_result['chunk_index'] // self.section_size
+                section_chunks = self.section_chunks[(file_path, index)]
+                section_chunks.append(chunk_result)
+                if len(section_chunks) == min(self.section_size, expected - index * self.section_size):
+                    section = self.section_chunks.pop((file_path, index))
+
+            self.file_chunks[file_path].append(chunk_result)
+            if len(self.file_chunks[file_path]) < expected:
+                return section, None
+            return section, self.file_chunks.pop(file_path)
+
+
+class FileFinalizer:
+    """Queue of completed files whose summaries are generated off the chunk workers.
+    Long files are reduced in sections of at most section_size summaries, so no
+    file summary prompt grows with the length of the file"""
+
+    def __init__(self, max_workers, writer, journal, manifest, section_size, reducer=None):
+        self.executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="finalizer")
+        # file summaries stream straight to disk instead of collecting in a dict
+        self.writer = writer
+        self.journal = journal
+        self.manifest = manifest
+        self.section_size = section_size
+        # receives each file summary so its package can reduce as soon as it is complete
+        self.reducer = reducer
+        self.futures = []
+        # file path -> futures of its section summaries
+        self.sections = defaultdict(list)
+        self.lock = threading.Lock()
+
+    def submit(self, file_path, chunk_results):
+        future = self.executor.submit(self._finalize, file_path, chunk_results)
+        with self.lock:
+            self.futures.append(future)
+        return future
+
+    def submit_section(self, file_path, chunk_results):
+        future = self.executor.submit(self._summarize_section, file_path, chunk_results)
+        with self.lock:
+            self.futures.append(future)
+            self.sections[file_path].append(future)
+        return future
+
+    def _summarize_section(self, file_path, chunk_results):
+        return self._reduce_parts(file_path, sorted(chunk_results, key=lambda x: x['start_line']))
+
+    def _reduce_parts(self, file_path, parts):
+        """One summary over consecutive parts, or the parts themselves if the call fails"""
+        if len(parts) == 1:
+            return parts
+        section_key, summary = known_section_summary(self, file_path, parts)
+        if summary is not None:
+            return section_part(parts, summary)
+
+        summary = summarize_section([part['summary'] for part in parts], file_path, parts[0]['start_line'], parts[-1]['end_line'])
+        return reduced_section(self, file_path, parts, section_key, summary)
+
+    def _file_parts(self, file_path, chunks, section_futures):
+        if not section_futures:
+            return chunks
+
+        # sections were queued ahead of this file, so they are running or done by now
+        parts = ordered_parts(future.result() for future in section_futures)
+
+        # only files of more than section_size squared chunks need another level
+        while len(parts) > self.section_size:
+            reduced = [
+                part for group in section_groups(parts, self.section_size)
+                for part in self._reduce_parts(file_path, group)
+            ]
+            if len(reduced) == len(parts):
+                break
+            parts = reduced
+        return parts
+
+    def _finalize(self, file_path, chunk_results):
+        chunks = sorted(chunk_results, key=lambda x: x['start_line'])
+        with self.lock:
+            section_futures = self.sections.pop(file_path, [])
+
+        file_key, file_summary = known_file_summary(self, file_path, chunks)
+        if file_summary is None:
+            parts = self._file_parts(file_path, chunks, section_futures)
+            file_summary = summarize_file(
+                [part['summary'] for part in parts],
+                file_path,
+                "Section" if section_futures else "Chunk"
+            )
+            record_file_summary(self, file_path, file_key, file_summary)
+
+        publish_file_summary(self, file_path, file_summary)
+        return file_summary
+
+    def drain(self):
+        """Wait for every queued file summary, then stop the queue; returns how many were written"""
+        with self.lock:
+            futures = list(self.futures)
+        for future in futures:
+            future.result()
+        self.executor.shutdown()
+        return self.writer.file_count
+
+
+class FrequencySketch:
+    """Count-min sketch of recent key popularity for TinyLFU admission"""
+
+    def __init__(self, width=4096, depth=4, max_count=15):
+        self.width = width
+        self.depth = depth
+        self.max_count = max_count
+        self.rows = [[0] * width for _ in range(depth)]
+        self.additions = 0
+        # halve every counter periodically so old popularity fades
+        self.reset_after = width * 10
 
-    def get_all_file_summaries(self):
-        return dict(self.shared_file_summaries)
+    def _slots(self, key):
+        return [hash((seed, key)) % self.width for seed in range(self.depth)]
+
+    def increment(self, key):
+        for row, slot in zip(self.rows, self._slots(key)):
+            if row[slot] < self.max_count:
+                row[slot] += 1
+
+        self.additions += 1
+        if self.additions >= self.reset_after:
+            self.rows = [[count // 2 for count in row] for row in self.rows]
+            self.additions //= 2
+
+    def estimate(self, key):
+        return min(row[slot] for row, slot in zip(self.rows, self._slots(key)))
 
 
 class SharedCache:
-    def __init__(self):
-        self.cache = {}
+    """Method summary cache bounded by bytes with LRU eviction and optional TinyLFU admission"""
+
+    def __init__(self, max_bytes, admission="tinylfu", wait_timeout=None):
+        # OrderedDict keeps recency order, so lookups, inserts and evictions are O(1)
+        self.cache = OrderedDict()
+        self.sizes = {}
+        self.resident_bytes = 0
+        self.max_bytes = max_bytes
+        self.sketch = FrequencySketch() if admission == "tinylfu" else None
         self.lock = threading.Lock()
-        self.pending = set()
-        self.max_size = 1000 # added to prevent memory issues
+        # key -> Future of the in-flight computation, awaited by later requesters
+        self.pending = {}
+        self.wait_timeout = wait_timeout
+
+    def put(self, key, value):
+        with self.lock:
+            self._store(key, value)
+
+    def get(self, key):
+        """The cached value or None, counted toward the key's popularity"""
+        with self.lock:
+            return self._lookup(key)
 
     def get_or_compute(self, key, compute_func):
+        """Single-flight lookup: one caller computes a missing key, concurrent callers
+        wait for its result and see its exception if it fails"""
         with self.lock:
-            if key in self.cache:
+            cached = self._lookup(key)
+            if cached is not None:
                 stats.log_cache_hit()
-                return self.cache[key]
+                return cached
             
-            if key in self.pending:
-                return None
-            
-            self.pending.add(key)
+            future = self.pending.get(key)
+            is_owner = future is None
+            if is_owner:
+                future = Future()
+                self.pending[key] = future
+
+        if not is_owner:
+            stats.log_cache_coalesced()
+            return self._wait_for(future)
+
         stats.log_cache_miss()
         
         try:
             result = compute_func()
-            
+        except Exception as e:
             with self.lock:
-                # simple lru eviction - remove oldest if too big
-                if len(self.cache) >= self.max_size:
-                    oldest_key = next(iter(self.cache))
-                    del self.cache[oldest_key]
+                self.pending.pop(key, None)
+            future.set_exception(e)
+            raise
+            
+        with self.lock:
+            self._store(key, result)
+            self.pending.pop(key, None)
+        
+        future.set_result(result)
+        return result
 
-                if len(self.cache) % 100 == 0:
-                    print(f"Cache size: {len(self.cache)} entries.")
+    def _lookup(self, key):
+        if self.sketch is not None:
+            self.sketch.increment(key)
 
-                self.cache[key] = result
-                self.pending.discard(key)
-            
-            return result
-            
-        except Exception:
-            with self.lock:
-                self.pending.discard(key)
+        if key not in self.cache:
             return None
+        self.cache.move_to_end(key)
+        return self.cache[key]
+
+    def _store(self, key, value):
+        size = len(key) + len(value.encode('utf-8')) if value else len(key)
+        if key in self.cache:
+            self.resident_bytes -= self.sizes.pop(key)
+            del self.cache[key]
+
+        if size > self.max_bytes:
+            return
+
+        # TinyLFU: only displace the LRU victim if the newcomer is seen more often
+        if self.sketch is not None and self.resident_bytes + size > self.max_bytes and self.cache:
+            victim = next(iter(self.cache))
+            if self.sketch.estimate(key) < self.sketch.estimate(victim):
+                stats.log_method_cache_rejection()
+                return
+
+        while self.cache and self.resident_bytes + size > self.max_bytes:
+            evicted_key, _ = self.cache.popitem(last=False)
+            self.resident_bytes -= self.sizes.pop(evicted_key)
+            stats.log_method_cache_eviction()
+
+        self.cache[key] = value
+        self.sizes[key] = size
+        self.resident_bytes += size
+        stats.log_method_cache_residency(len(self.cache), self.resident_bytes)
+
+    def _wait_for(self, future):
+        started = time.monotonic()
+        try:
+            return future.result(timeout=self.wait_timeout)
+        finally:
+            stats.log_cache_wait(time.monotonic() - started, timed_out=not future.done())
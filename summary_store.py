@@ -0,0 +1,139 @@
+import os
+import json
+import sqlite3
+import threading
+
+from results_writer import iter_results
+
+
+class SummaryStore:
+    """File summaries in SQLite, indexed by path, package and content hash, so readers
+    can sample, look up or iterate summaries without loading the whole project"""
+
+    def __init__(self, path, reset=False):
+        self.path = path
+        self.lock = threading.Lock()
+
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        if reset and os.path.exists(path):
+            os.remove(path)
+
+        self.conn = sqlite3.connect(path, check_same_thread=False)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute(
+            "CREATE TABLE IF NOT EXISTS files ("
+            "path TEXT PRIMARY KEY, package TEXT NOT NULL, content_hash TEXT, summary TEXT NOT NULL)"
+        )
+        self.conn.execute("CREATE INDEX IF NOT EXISTS files_package ON files (package)")
+        self.conn.execute("CREATE INDEX IF NOT EXISTS files_content_hash ON files (content_hash)")
+        self.conn.execute("CREATE TABLE IF NOT EXISTS project (key TEXT PRIMARY KEY, value TEXT NOT NULL)")
+        self.conn.commit()
+
+    def add_file(self, file_path, summary, content_hash=None):
+        self.add_files([(file_path, summary, content_hash)])
+
+    def add_files(self, files):
+        """Insert (path, summary, content hash) rows in one transaction"""
+        with self.lock:
+            self.conn.executemany(
+                "INSERT OR REPLACE INTO files (path, package, content_hash, summary) VALUES (?, ?, ?, ?)",
+                [(file_path, os.path.dirname(file_path), content_hash, summary)
+                 for file_path, summary, content_hash in files]
+            )
+            self.conn.commit()
+
+    def set_project(self, record):
+        """Project summary and totals, one row per field"""
+        with self.lock:
+            self.conn.executemany(
+                "INSERT OR REPLACE INTO project (key, value) VALUES (?, ?)",
+                [(key, json.dumps(value, ensure_ascii=False)) for key, value in record.items() if key != "type"]
+            )
+            self.conn.commit()
+
+    def project(self):
+        with self.lock:
+            rows = self.conn.execute("SELECT key, value FROM project").fetchall()
+        return {key: json.loads(value) for key, value in rows}
+
+    def get(self, file_path):
+        with self.lock:
+            row = self.conn.execute("SELECT summary FROM files WHERE path = ?", (file_path,)).fetchone()
+        return row[0] if row else None
+
+    def count(self, package=None):
+        with self.lock:
+            if package is None:
+                return self.conn.execute("SELECT COUNT(*) FROM files").fetchone()[0]
+            return self.conn.execute("SELECT COUNT(*) FROM files WHERE package = ?", (package,)).fetchone()[0]
+
+    def sample(self, sample_size, package=None):
+        """A uniform random sample of (path, summary) pairs"""
+        query = "SELECT path, summary FROM files"
+        params = ()
+        if package is not None:
+            query += " WHERE package = ?"
+            params = (package,)
+        with self.lock:
+            return self.conn.execute(query + " ORDER BY RANDOM() LIMIT ?", params + (sample_size,)).fetchall()
+
+    def paths_with_hash(self, content_hash):
+        with self.lock:
+            rows = self.conn.execute("SELECT path FROM files WHERE content_hash = ?", (content_hash,)).fetchall()
+        return [row[0] for row in rows]
+
+    def iter_files(self, package=None, batch_size=500):
+        """Yields (path, summary) in path order, batch_size rows at a time"""
+        last_path = ""
+        while True:
+            query = "SELECT path, summary FROM files WHERE path > ?"
+            params = (last_path,)
+            if package is not None:
+                query += " AND package = ?"
+                params += (package,)
+            with self.lock:
+                rows = self.conn.execute(query + " ORDER BY path LIMIT ?", params + (batch_size,)).fetchall()
+            if not rows:
+                return
+            yield from rows
+            last_path = rows[-1][0]
+
+    def close(self):
+        with self.lock:
+            if self.conn is not None:
+                self.conn.close()
+                self.conn = None
+
+
+def open_summary_store(path):
+    """Opens a summary store, first building one next to a summary_<project>.json or
+    results stream the first time it is read, so later readers skip the parse"""
+    if path.endswith('.sqlite'):
+        return SummaryStore(path)
+
+    store_path = path
+    for suffix in ('.jsonl.gz', '.jsonl', '.json'):
+        if path.endswith(suffix):
+            store_path = path[:-len(suffix)] + '.sqlite'
+            break
+    if os.path.exists(store_path) and os.path.getmtime(store_path) >= os.path.getmtime(path):
+        return SummaryStore(store_path)
+
+    store = SummaryStore(store_path, reset=True)
+    if path.endswith('.json'):
+        # the legacy layout has to be parsed whole, but only this once
+        with open(path, 'r', encoding='utf-8') as f:
+            data = json.load(f)
+        store.add_files((file_path, summary, None) for file_path, summary in data.pop('file_summaries', {}).items())
+        store.set_project(data)
+    else:
+        store.add_files(
+            (record['path'], record['summary'], record.get('content_hash'))
+            for record in iter_results(path) if record['type'] == 'file'
+        )
+        for record in iter_results(path):
+            if record['type'] == 'project':
+                store.set_project(record)
+    return store
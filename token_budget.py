@@ -0,0 +1,100 @@
+import json
+import threading
+
+from config import CLAUDE_CONFIG, OPENAI_CONFIG
+
+try:
+    import tiktoken
+except ImportError:
+    tiktoken = None
+
+
+TRUNCATION_MARKER = "\n... [truncated to fit the context window]"
+
+
+class TokenBudget:
+    """Estimates prompt sizes and trims inputs so requests fit the model context"""
+
+    def __init__(self, context_window, max_output_tokens, safety_margin=0.05):
+        self.input_budget = int((context_window - max_output_tokens) * (1 - safety_margin))
+        self.lock = threading.Lock()
+        self.encoding = None
+        self.encoding_loaded = False
+        # tiktoken's encoding is not the provider's tokenizer, so scale its
+        # counts by the observed ratio of billed to estimated input tokens
+        self.ratio = 1.0
+
+    def _get_encoding(self):
+        if not self.encoding_loaded:
+            with self.lock:
+                if not self.encoding_loaded:
+                    try:
+                        self.encoding = tiktoken.get_encoding("cl100k_base") if tiktoken else None
+                    except Exception as e:
+                        print(f"tiktoken unavailable ({e}), estimating 4 characters per token")
+                    self.encoding_loaded = True
+        return self.encoding
+
+    def count(self, text):
+        encoding = self._get_encoding()
+        if encoding is None:
+            raw = len(text) / 4
+        else:
+            raw = len(encoding.encode(text, disallowed_special=()))
+        return int(raw * self.ratio) + 1
+
+    def count_payload(self, payload):
+        parts = [message["content"] if isinstance(message["content"], str) else json.dumps(message["content"])
+                 for message in payload["messages"]]
+        for block in payload.get("system") or []:
+            parts.append(block["text"])
+
+        # a few tokens of framing per message
+        return sum(self.count(part) for part in parts) + 4 * len(parts)
+
+    def calibrate(self, predicted, actual):
+        if predicted <= 0 or actual <= 0:
+            return
+        with self.lock:
+            self.ratio = min(max(0.9 * self.ratio + 0.1 * self.ratio * actual / predicted, 0.5), 2.0)
+
+    def fits(self, payload):
+        return self.count_payload(payload) <= self.input_budget
+
+    def fit_text(self, text, reserved_tokens=0):
+        """Truncate text so it plus reserved_tokens stays inside the input budget"""
+        available = self.input_budget - reserved_tokens
+        size = self.count(text)
+        if size <= available:
+            return text
+
+        keep = max(int(len(text) * available / size) - len(TRUNCATION_MARKER), 0)
+        print(f"Truncating prompt input from ~{size} to ~{available} tokens")
+        return text[:keep] + TRUNCATION_MARKER
+
+    def fit_items(self, items, reserved_tokens=0, separator_tokens=8):
+        """Trim a list of texts so all of them together fit, sharing the budget evenly"""
+        available = self.input_budget - reserved_tokens - separator_tokens * len(items)
+        sizes = [self.count(item) for item in items]
+        if sum(sizes) <= available or not items:
+            return list(items)
+
+        # short items keep their full text, long ones split what is left
+        share = available // len(items)
+        for _ in range(len(items)):
+            short = [size for size in sizes if size <= share]
+            long_count = len(items) - len(short)
+            if long_count == 0:
+                break
+            new_share = (available - sum(short)) // long_count
+            if new_share == share:
+                break
+            share = new_share
+
+        print(f"Trimming {len(items)} prompt items from ~{sum(sizes)} to ~{available} tokens")
+        return [item if size <= share else self.fit_text(item, self.input_budget - share)
+                for item, size in zip(items, sizes)]
+
+
+claude_budget = TokenBudget(CLAUDE_CONFIG["context_window"], CLAUDE_CONFIG["max_tokens"])
+openai_budget = TokenBudget(OPENAI_CONFIG["context_window"], OPENAI_CONFIG["max_tokens"])
@@ -0,0 +1,163 @@
+import time
+import threading
+import requests
+from collections import defaultdict, deque
+from concurrent.futures import ThreadPoolExecutor, TimeoutError, wait, FIRST_COMPLETED
+from requests.adapters import HTTPAdapter
+
+from config import SUMMARIZER_CONFIG, TRANSPORT_CONFIG
+from stats_collector import stats
+
+
+def adaptive_timeout(predicted_tokens):
+    """Read timeout that grows with the prompt instead of a flat 60 seconds"""
+    timeout = TRANSPORT_CONFIG["base_timeout"] + predicted_tokens / 1000 * TRANSPORT_CONFIG["timeout_per_1k_tokens"]
+    return min(timeout, TRANSPORT_CONFIG["max_timeout"])
+
+
+class LatencyTracker:
+    """Recent successful response times per call category"""
+
+    def __init__(self, window=500):
+        self.lock = threading.Lock()
+        self.samples = defaultdict(lambda: deque(maxlen=window))
+        self.requests = defaultdict(int)
+        self.hedges = defaultdict(int)
+
+    def record(self, category, seconds):
+        with self.lock:
+            self.samples[category].append(seconds)
+
+    def percentile(self, category, q):
+        with self.lock:
+            samples = sorted(self.samples[category])
+        if not samples:
+            return None
+        return samples[min(int(q * len(samples)), len(samples) - 1)]
+
+    def hedge_delay(self, category):
+        """Seconds to wait before hedging a request, or None if it should not be hedged"""
+        if not TRANSPORT_CONFIG["hedge_requests"] or category not in TRANSPORT_CONFIG["hedge_categories"]:
+            return None
+
+        with self.lock:
+            self.requests[category] += 1
+            # duplicates cost money, so cap them at a fraction of the traffic
+            if self.hedges[category] >= TRANSPORT_CONFIG["hedge_budget"] * self.requests[category]:
+                return None
+            if len(self.samples[category]) < TRANSPORT_CONFIG["hedge_min_samples"]:
+                return None
+
+        return self.percentile(category, 0.95)
+
+    def record_hedge(self, category):
+        with self.lock:
+            self.hedges[category] += 1
+
+
+latency_tracker = LatencyTracker()
+
+
+class HttpTransport:
+    """Keep-alive session shared by every LLM client in the process"""
+
+    def __init__(self, pool_size):
+        self.pool_size = pool_size
+        # every caller can have a primary and a hedge in flight at once
+        connections = pool_size * 2 if TRANSPORT_CONFIG["hedge_requests"] else pool_size
+        self.session = requests.Session()
+        # one pool per host, each holding up to that many idle connections
+        # so every summarizer thread can keep its socket warm
+        self.adapter = HTTPAdapter(pool_connections=4, pool_maxsize=connections)
+        self.session.mount("https://", self.adapter)
+        self.session.mount("http://", self.adapter)
+        self.lock = threading.Lock()
+        self.hedge_pool = ThreadPoolExecutor(max_workers=connections)
+
+    def post(self, url, headers, payload, timeout):
+        stats.log_request_sent()
+        response = self.session.post(url, headers=headers, json=payload, timeout=timeout)
+        self._record_connection_usage()
+        return response
+
+    def post_adaptive(self, url, headers, payload, category, predicted_tokens, rate_limiter):
+        """POST with a size-scaled timeout, hedging the request once it passes the category p95.
+        The caller paces the first request; a hedge takes its own turn from rate_limiter"""
+        timeout = adaptive_timeout(predicted_tokens)
+        hedge_after = latency_tracker.hedge_delay(category)
+        started = time.monotonic()
+
+        if hedge_after is None:
+            response = self.post(url, headers, payload, timeout)
+        else:
+            response = self._post_hedged(url, headers, payload, timeout, category, hedge_after,
+                                         rate_limiter, predicted_tokens)
+
+        if response.status_code == 200:
+            latency_tracker.record(category, time.monotonic() - started)
+        return response
+
+    def _post_hedged(self, url, headers, payload, timeout, category, hedge_after, rate_limiter, predicted_tokens):
+        primary = self.hedge_pool.submit(self.post, url, headers, payload, timeout)
+        try:
+            return primary.result(timeout=hedge_after)
+        except TimeoutError:
+            pass
+
+        # the duplicate is a real request: it waits its turn, still giving way to the
+        # primary, and counts toward the run's calls
+        wait_time = rate_limiter.reserve(predicted_tokens)
+        if wait_time > 0:
+            try:
+                return primary.result(timeout=wait_time)
+            except TimeoutError:
+                pass
+
+        stats.log_llm_call("api_request")
+        latency_tracker.record_hedge(category)
+        hedge = self.hedge_pool.submit(self.post, url, headers, payload, timeout)
+        pending = {primary, hedge}
+
+        # take the first response; fall back to the other request if the first one raised
+        while True:
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            winner = next((future for future in done if future.exception() is None), None)
+            if winner is not None or not pending:
+                break
+
+        for future in pending:
+            # requests cannot abort a send in progress, so drop the loser's response when it lands
+            if not future.cancel():
+                future.add_done_callback(_discard_response)
+
+        if winner is None:
+            winner = done.pop()
+        stats.log_hedge(category, won=winner is hedge)
+        return winner.result()
+
+    def _record_connection_usage(self):
+        # requests keys pools by tls settings as well as host, so total them per host
+        usage = {}
+        with self.lock:
+            pools = self.adapter.poolmanager.pools
+            for key in pools.keys():
+                pool = pools.get(key)
+                if pool is None:
+                    continue
+                sent, opened = usage.get(pool.host, (0, 0))
+                usage[pool.host] = (sent + pool.num_requests, opened + pool.num_connections)
+
+        for host, (sent, opened) in usage.items():
+            stats.log_connection_usage(host, sent, opened)
+
+    def close(self):
+        self.hedge_pool.shutdown(wait=False)
+        self.session.close()
+
+
+def _discard_response(future):
+    if future.exception() is None:
+        future.result().close()
+
+
+transport = HttpTransport(SUMMARIZER_CONFIG["max_workers"])